@@ -0,0 +1,99 @@
+import numpy as np
+import pandas as pd
+from rapidfuzz import process, fuzz
+
+# ——— PARAMETERS ———
+BATCH_CHUNK_ROWS = 1000  # query rows scored per cdist call (bounds the score matrix size)
+
+# ---------------------- Batch Candidate Generation ----------------------
+
+def _top_k(scores: np.ndarray, limit: int, score_cutoff):
+    """
+    Indices of the `limit` best scores in one row, ordered the way process.extract
+    orders them: score descending, ties broken by the lower choice index.
+    """
+    keep = scores >= score_cutoff if score_cutoff is not None else np.ones(len(scores), dtype=bool)
+    if limit < keep.sum():
+        kth = np.partition(scores, len(scores) - limit)[len(scores) - limit]
+        keep &= scores >= kth
+    idx = np.flatnonzero(keep)
+    order = np.lexsort((idx, -scores[idx]))
+    return idx[order][:limit]
+
+def batch_extract(queries, choices, scorer=fuzz.token_sort_ratio, limit=5,
+                  score_cutoff=None, workers=-1):
+    """
+    Score every distinct query against `choices` in one matrix pass and return
+    {query: [(choice, score, index), ...]} — the same top-`limit` list
+    process.extract(query, choices, scorer=scorer, limit=limit) gives per row,
+    minus candidates below `score_cutoff`.
+    """
+    queries = list(dict.fromkeys(queries))
+    choices = list(choices)
+    results = {}
+    if not queries:
+        return results
+    if not choices:
+        return {q: [] for q in queries}
+
+    for start in range(0, len(queries), BATCH_CHUNK_ROWS):
+        chunk = queries[start:start + BATCH_CHUNK_ROWS]
+        # float64 keeps scores bit-identical to the per-row scorer output
+        matrix = process.cdist(
+            chunk, choices, scorer=scorer, dtype=np.float64,
+            score_cutoff=score_cutoff, workers=workers
+        )
+        for query, scores in zip(chunk, matrix):
+            results[query] = [(choices[j], float(scores[j]), int(j))
+                              for j in _top_k(scores, limit, score_cutoff)]
+    return results
+
+def _block_id(key):
+    # NaN never equals itself, so collapse nulls before using a key for grouping
+    return tuple(None if v is None or (isinstance(v, float) and np.isnan(v)) else v for v in key)
+
+def batch_extract_blocked(queries, block_keys, choices, block_mask, scorer=fuzz.token_sort_ratio,
+                          limit=5, score_cutoff=None, workers=-1):
+    """
+    Blocked variant of batch_extract: each query is scored only against the choices
+    its block allows. `block_keys[i]` is the tuple of row attributes for queries[i] and
+    block_mask(key) returns a boolean array over `choices` (computed once per block).
+    An empty block falls back to the full choice list.
+    Returns a list of candidate lists aligned with `queries`; indices refer to `choices`.
+    """
+    queries = list(queries)
+    choices = list(choices)
+    groups = {}
+    for pos, key in enumerate(block_keys):
+        groups.setdefault(_block_id(key), (key, []))[1].append(pos)
+
+    out = [[] for _ in queries]
+    for key, positions in groups.values():
+        subset = np.flatnonzero(block_mask(key))
+        if not len(subset):
+            subset = np.arange(len(choices))
+        found = batch_extract(
+            [queries[p] for p in positions], [choices[j] for j in subset],
+            scorer=scorer, limit=limit, score_cutoff=score_cutoff, workers=workers
+        )
+        for p in positions:
+            out[p] = [(c, sc, int(subset[j])) for c, sc, j in found[queries[p]]]
+    return out
+
+# ---------------------- Unique Match Keys ----------------------
+
+def unique_match_keys(frame: pd.DataFrame, keys):
+    """
+    Reduce `frame` to one row per distinct combination of `keys`.
+    Returns (unique_frame, codes) where codes[i] is the position in unique_frame
+    of row i's key, so per-key results can be broadcast back with broadcast_results.
+    """
+    codes = frame.groupby(keys, dropna=False, sort=False).ngroup().to_numpy()
+    first = ~pd.Series(codes).duplicated().to_numpy()
+    return frame.loc[first].reset_index(drop=True), codes
+
+def broadcast_results(frame: pd.DataFrame, results: pd.DataFrame, codes):
+    """Write each per-key result column onto every row of `frame` sharing that key."""
+    for col in results.columns:
+        frame[col] = results[col].to_numpy()[codes]
+    return frame
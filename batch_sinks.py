@@ -0,0 +1,38 @@
+import os
+import pandas as pd
+
+# ---------------------- Batch Sinks ----------------------
+# Receive matched / unmatched frames one batch at a time from the streaming cleaners,
+# so a long history never has to be held in memory at once.
+
+class CsvBatchSink:
+    """
+    Appends each batch to matched / unmatched CSV files in `folder` (either frame may be None).
+    The header is written with the first batch and later batches are aligned to its columns.
+    """
+
+    def __init__(self, folder: str,
+                 matched_name: str = "matched_sales_with_snop_category.csv",
+                 unmatched_name: str = "unmatched_sales_without_snop_category.csv"):
+        os.makedirs(folder, exist_ok=True)
+        self.paths = {
+            'matched': os.path.join(folder, matched_name),
+            'unmatched': os.path.join(folder, unmatched_name),
+        }
+        self.columns = {}
+        self.rows = {'matched': 0, 'unmatched': 0}
+
+    def write(self, matched: pd.DataFrame, unmatched: pd.DataFrame):
+        for kind, df in (('matched', matched), ('unmatched', unmatched)):
+            if df is None:
+                continue
+            first = kind not in self.columns
+            if first:
+                self.columns[kind] = list(df.columns)
+            df.reindex(columns=self.columns[kind]).to_csv(
+                self.paths[kind], mode='w' if first else 'a', header=first, index=False
+            )
+            self.rows[kind] += len(df)
+
+    def close(self):
+        pass
@@ -0,0 +1,67 @@
+import os
+import tempfile
+import time
+import uuid
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from pipeline_log import get_logger
+
+log = get_logger("upload")
+
+# ——— PARAMETERS ———
+LOAD_CHUNK_ROWS  = int(os.getenv("LOAD_CHUNK_ROWS", "250000"))  # rows per Parquet file
+LOAD_PARALLEL    = int(os.getenv("LOAD_PARALLEL", "4"))         # files written and PUT concurrently
+LOAD_COMPRESSION = os.getenv("LOAD_COMPRESSION", "zstd")        # Parquet codec: zstd | snappy | gzip
+LOAD_STAGE       = "NEA_BULK_LOAD"                               # session-scoped internal stage
+
+LoadStats = namedtuple("LoadStats", ["table", "rows", "bytes", "files", "seconds"])
+
+# ---------------------- Parquet Chunks ----------------------
+
+def _write_chunk(args):
+    frame, path = args
+    table = pa.Table.from_pandas(frame, preserve_index=False)
+    pq.write_table(table, path, compression=LOAD_COMPRESSION, coerce_timestamps="us", allow_truncated_timestamps=True)
+    return os.path.getsize(path)
+
+def write_chunks(df: pd.DataFrame, folder: str, chunk_rows: int = LOAD_CHUNK_ROWS, parallel: int = LOAD_PARALLEL):
+    """Split `df` into compressed Parquet files of at most `chunk_rows` rows, written concurrently; (total bytes, files)."""
+    chunks = [(df.iloc[i:i + chunk_rows], os.path.join(folder, f"chunk_{n:05d}.parquet"))
+              for n, i in enumerate(range(0, len(df), chunk_rows))]
+    with ThreadPoolExecutor(max_workers=max(1, parallel)) as pool:  # pyarrow encodes outside the GIL
+        return sum(pool.map(_write_chunk, chunks)), len(chunks)
+
+# ---------------------- Stage + COPY ----------------------
+
+def bulk_load(conn, df: pd.DataFrame, table_name: str,
+              chunk_rows: int = LOAD_CHUNK_ROWS, parallel: int = LOAD_PARALLEL) -> LoadStats:
+    """
+    Load `df` into the existing table `table_name`: Parquet chunks are PUT to an internal stage
+    (PARALLEL uploads) and loaded with one COPY INTO, matched to the table's columns by name.
+    """
+    started = time.perf_counter()
+    prefix = f"{table_name}/{uuid.uuid4().hex[:12]}"
+    nbytes = files = 0
+    if not df.empty:
+        with tempfile.TemporaryDirectory(prefix="nea_load_") as folder, conn.cursor() as cs:
+            nbytes, files = write_chunks(df, folder, chunk_rows, parallel)
+            cs.execute(f"CREATE TEMPORARY STAGE IF NOT EXISTS {LOAD_STAGE}")
+            cs.execute(f"PUT 'file://{Path(folder).as_posix()}/*.parquet' @{LOAD_STAGE}/{prefix} "
+                       f"PARALLEL={max(1, parallel)} AUTO_COMPRESS=FALSE")
+            cs.execute(f"COPY INTO {table_name} FROM @{LOAD_STAGE}/{prefix}/ "
+                       f"FILE_FORMAT=(TYPE=PARQUET USE_LOGICAL_TYPE=TRUE) "
+                       f"MATCH_BY_COLUMN_NAME=CASE_SENSITIVE PURGE=TRUE")
+    return LoadStats(table_name, len(df), nbytes, files, time.perf_counter() - started)
+
+# ---------------------- Throughput ----------------------
+
+def log_throughput(stats: LoadStats, label: str = None):
+    """One INFO line per loaded table: rows, files, MB and rows/s, MB/s over the stage + COPY time."""
+    seconds = max(stats.seconds, 1e-6)
+    mb = stats.bytes / 1e6
+    log.info("📦 Loaded %s: %d rows in %d file(s), %.1f MB, %.1fs (%.0f rows/s, %.2f MB/s)",
+             label or stats.table, stats.rows, stats.files, mb, stats.seconds, stats.rows / seconds, mb / seconds)
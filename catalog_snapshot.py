@@ -0,0 +1,83 @@
+import json
+import os
+from datetime import datetime
+import pandas as pd
+from match_cache import MATCH_CACHE_PATH, catalog_fingerprint
+from pipeline_log import get_logger
+from snowflake_sessions import get_connection
+from snowflake_fetch import fetch_frame
+from extract_queries import QUERY_TIMEOUT
+
+log = get_logger("catalog")
+
+# ——— PARAMETERS ———
+# Kept next to the match cache by default so the workflow's cache step carries both between runs.
+CATALOG_SNAPSHOT_DIR = os.getenv("CATALOG_SNAPSHOT_DIR", os.path.dirname(MATCH_CACHE_PATH) or ".")
+CATALOG_TABLE        = "PRODUCT_CATALOG"
+
+# cheap change probe: row count + order-independent content hash, computed inside Snowflake
+PROBE_QUERY = f"SELECT COUNT(*), HASH_AGG(*) FROM {CATALOG_TABLE}"
+
+# ---------------------- Snapshot Files ----------------------
+
+def _snapshot_paths(snapshot_dir: str):
+    base = os.path.join(snapshot_dir, "product_catalog")
+    return base + ".parquet", base + ".json"
+
+def _read_snapshot(snapshot_dir: str):
+    data_path, meta_path = _snapshot_paths(snapshot_dir)
+    if not (os.path.exists(data_path) and os.path.exists(meta_path)):
+        return None, None
+    try:
+        with open(meta_path, encoding="utf-8") as f:
+            meta = json.load(f)
+        return pd.read_parquet(data_path), meta
+    except Exception as e:
+        log.warning("⚠️ Catalog snapshot unreadable, refetching: %s", e)
+        return None, None
+
+def _write_snapshot(snapshot_dir: str, catalog_df: pd.DataFrame, meta: dict):
+    data_path, meta_path = _snapshot_paths(snapshot_dir)
+    try:
+        os.makedirs(snapshot_dir, exist_ok=True)
+        # data first, metadata last: a run interrupted in between just refetches next time
+        catalog_df.to_parquet(data_path + ".tmp", index=False)
+        os.replace(data_path + ".tmp", data_path)
+        with open(meta_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(meta_path + ".tmp", meta_path)
+    except Exception as e:
+        log.warning("⚠️ Could not save catalog snapshot (continuing without it): %s", e)
+
+# ---------------------- Snapshot Load ----------------------
+
+def load_catalog_snapshot(snapshot_dir: str = CATALOG_SNAPSHOT_DIR):
+    """
+    (catalog_df, snapshot_version). Probes PRODUCT_CATALOG for row count + HASH_AGG and reuses
+    the local Parquet snapshot when both are unchanged; otherwise fetches the full table and
+    saves a new snapshot. snapshot_version is the content fingerprint of the catalog, stable
+    across runs until the catalog changes, so downstream caches can key on it.
+    """
+    conn = get_connection('target')
+    with conn.cursor() as cs:
+        cs.execute(PROBE_QUERY, timeout=QUERY_TIMEOUT)
+        count, content_hash = cs.fetchone()
+    probe = [int(count), str(content_hash)]
+
+    catalog_df, meta = _read_snapshot(snapshot_dir)
+    if catalog_df is not None and meta.get("probe") == probe:
+        log.info("✅ Product catalog unchanged (%d rows), using local snapshot %s", probe[0], meta['version'][:12])
+        return catalog_df, meta["version"]
+
+    with conn.cursor() as cs:
+        cs.execute(f"SELECT * FROM {CATALOG_TABLE}", timeout=QUERY_TIMEOUT)
+        catalog_df = fetch_frame(cs)
+
+    version = catalog_fingerprint(catalog_df)
+    _write_snapshot(snapshot_dir, catalog_df, {
+        "probe": probe,
+        "version": version,
+        "fetched_at": datetime.now().isoformat(timespec="seconds"),
+    })
+    log.info("✅ Fetched product catalog (%d rows), snapshot %s", len(catalog_df), version[:12])
+    return catalog_df, version
@@ -0,0 +1,199 @@
+import datetime
+import hashlib
+import importlib
+import io
+import json
+import os
+import shutil
+import threading
+import numpy as np
+import pandas as pd
+from match_cache import MATCH_CACHE_PATH
+from pipeline_log import get_logger
+
+log = get_logger("checkpoints")
+
+# ——— PARAMETERS ———
+# One folder per pipeline run: manifest.json plus content-addressed Parquet files (<sha256>.parquet),
+# so a frame shared by several stages is stored once and verified on load. A run that finishes
+# cleanly deletes its folder; a failed one is kept for `run_pipeline.py --resume <run-id>`.
+CHECKPOINT_DIR       = os.getenv("CHECKPOINT_DIR", os.path.join(os.path.dirname(MATCH_CACHE_PATH) or ".", "runs"))
+CHECKPOINTS          = os.getenv("CHECKPOINTS", "1").strip().lower() not in ("0", "false", "no")
+CHECKPOINT_KEEP_RUNS = int(os.getenv("CHECKPOINT_KEEP_RUNS", "3"))  # failed runs kept for resuming
+
+# ---------------------- Value Encoding ----------------------
+# Stage values are DataFrames, (named)tuples, dicts and dates; anything else is not checkpointed.
+
+def _encode(value, run):
+    if isinstance(value, pd.DataFrame):
+        return {"frame": run.write_frame(value)}
+    if isinstance(value, tuple) and hasattr(value, "_fields"):
+        cls = type(value)
+        return {"namedtuple": f"{cls.__module__}:{cls.__qualname__}", "items": [_encode(v, run) for v in value]}
+    if isinstance(value, (tuple, list)):
+        return {"tuple": [_encode(v, run) for v in value]}
+    if isinstance(value, dict):
+        return {"dict": [[str(k), _encode(v, run)] for k, v in value.items()]}
+    if isinstance(value, datetime.datetime):
+        return {"datetime": value.isoformat()}
+    if isinstance(value, datetime.date):
+        return {"date": value.isoformat()}
+    if isinstance(value, np.generic):
+        value = value.item()
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return {"value": value}
+    raise TypeError(f"cannot checkpoint {type(value).__name__}")
+
+def _decode(data, run):
+    if "namedtuple" in data:
+        module, name = data["namedtuple"].split(":")
+        return getattr(importlib.import_module(module), name)(*(_decode(v, run) for v in data["items"]))
+    kind, payload = next(iter(data.items()))
+    if kind == "frame":
+        return run.read_frame(payload)
+    if kind == "tuple":
+        return tuple(_decode(v, run) for v in payload)
+    if kind == "dict":
+        return {k: _decode(v, run) for k, v in payload}
+    if kind == "datetime":
+        return datetime.datetime.fromisoformat(payload)
+    if kind == "date":
+        return datetime.date.fromisoformat(payload)
+    return payload
+
+# ---------------------- Run Folder ----------------------
+
+class RunCheckpoints:
+    """
+    Checkpoints of one pipeline run. `stages` holds the encoded value of every completed graph
+    stage (None when its value cannot be stored), `artifacts` the values saved through reuse().
+    """
+
+    def __init__(self, run_id: str, root: str = CHECKPOINT_DIR):
+        self.run_id = run_id
+        self.folder = os.path.join(root, run_id)
+        self.manifest_path = os.path.join(self.folder, "manifest.json")
+        self._lock = threading.Lock()  # stages finish and save artifacts from several threads
+        self.manifest = {"run_id": run_id, "targets": [], "stages": {}, "artifacts": {}}
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, encoding="utf-8") as f:
+                self.manifest = json.load(f)
+
+    @classmethod
+    def new(cls, targets, root: str = CHECKPOINT_DIR):
+        run_id = datetime.datetime.now().strftime("%Y%m%d-%H%M%S-") + os.urandom(2).hex()
+        _prune(root, keep=max(0, CHECKPOINT_KEEP_RUNS - 1))
+        run = cls(run_id, root)
+        run.manifest["targets"] = list(targets)
+        run._save_manifest()
+        return run
+
+    @classmethod
+    def resume(cls, run_id: str, root: str = CHECKPOINT_DIR):
+        run = cls(run_id, root)
+        if not os.path.exists(run.manifest_path):
+            raise SystemExit(f"❌ No checkpoints for run {run_id} in {root}")
+        return run
+
+    # --- Frames ---
+
+    def write_frame(self, df: pd.DataFrame) -> str:
+        buffer = io.BytesIO()
+        df.to_parquet(buffer, index=False)
+        data = buffer.getvalue()
+        digest = hashlib.sha256(data).hexdigest()
+        path = os.path.join(self.folder, digest + ".parquet")
+        if not os.path.exists(path):
+            with open(path + ".tmp", "wb") as f:
+                f.write(data)
+            os.replace(path + ".tmp", path)
+        return digest
+
+    def read_frame(self, digest: str) -> pd.DataFrame:
+        with open(os.path.join(self.folder, digest + ".parquet"), "rb") as f:
+            data = f.read()
+        if hashlib.sha256(data).hexdigest() != digest:
+            raise ValueError(f"checkpoint {digest[:12]} is corrupt")
+        return pd.read_parquet(io.BytesIO(data))
+
+    # --- Stages ---
+
+    def completed(self) -> dict:
+        """name -> (stored, value) for every stage that finished in this run."""
+        done = {}
+        for name, encoded in self.manifest["stages"].items():
+            try:
+                done[name] = (True, _decode(encoded, self)) if encoded is not None else (False, None)
+            except Exception as e:
+                log.warning("⚠️ Checkpoint of %s unreadable, rerunning it: %s", name, e)
+        return done
+
+    def save_stage(self, name: str, result):
+        """run_graph on_done hook: store the value of a stage that succeeded."""
+        encoded = self._encode_or_none(name, result.value)
+        with self._lock:
+            self.manifest["stages"][name] = encoded
+            self._save_manifest()
+
+    # --- Artifacts (intermediate frames inside a stage, e.g. raw extracts) ---
+
+    def reuse(self, key: str, compute):
+        with self._lock:
+            encoded = self.manifest["artifacts"].get(key)
+        if encoded is not None:
+            try:
+                value = _decode(encoded, self)
+                log.info("♻️ %s from checkpoint %s", key, self.run_id)
+                return value
+            except Exception as e:
+                log.warning("⚠️ Checkpoint %s unreadable, recomputing: %s", key, e)
+        value = compute()
+        encoded = self._encode_or_none(key, value)
+        if encoded is not None:
+            with self._lock:
+                self.manifest["artifacts"][key] = encoded
+                self._save_manifest()
+        return value
+
+    def _encode_or_none(self, name, value):
+        try:
+            os.makedirs(self.folder, exist_ok=True)
+            return _encode(value, self)
+        except Exception as e:
+            log.warning("⚠️ %s not checkpointed, a resumed run recomputes it: %s", name, e)
+            return None
+
+    def _save_manifest(self):
+        try:
+            os.makedirs(self.folder, exist_ok=True)
+            with open(self.manifest_path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump(self.manifest, f)
+            os.replace(self.manifest_path + ".tmp", self.manifest_path)
+        except OSError as e:
+            log.warning("⚠️ Could not save checkpoint manifest (continuing without it): %s", e)
+
+    def discard(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+def _prune(root: str, keep: int):
+    if not os.path.isdir(root):
+        return
+    runs = sorted(d for d in os.listdir(root) if os.path.isdir(os.path.join(root, d)))
+    for run_id in runs[:max(0, len(runs) - keep)]:
+        shutil.rmtree(os.path.join(root, run_id), ignore_errors=True)
+        log.debug("Pruned checkpoints of run %s", run_id)
+
+# ---------------------- Active Run ----------------------
+# Set by run_pipeline.py; cleaners called on their own (CLI, tests) just compute.
+
+_ACTIVE = None
+
+def activate(run):
+    global _ACTIVE
+    _ACTIVE = run
+
+def reuse(key: str, compute):
+    """compute(), or its value saved under `key` by this run before it failed (see --resume)."""
+    if _ACTIVE is None:
+        return compute()
+    return _ACTIVE.reuse(key, compute)
@@ -0,0 +1,174 @@
+import os
+from collections import namedtuple
+import pandas as pd
+from pipeline_log import get_logger
+from snowflake_fetch import fetch_frame
+
+log = get_logger("extract")
+
+# ——— PARAMETERS ———
+QUERY_TIMEOUT      = int(os.getenv("QUERY_TIMEOUT", "1800"))  # seconds per extract query; Snowflake cancels it after that
+WRONG_BRAND_DETAIL = os.getenv("WRONG_BRAND_DETAIL", "1").strip().lower() not in ("0", "false", "no")
+
+APPROVED_BRANDS = [
+    'NEA Fire', 'NEA Premium', 'NEA Awarded', 'Sapura', 'Cannatini', 'Valorem',
+    'Dab FX', 'Double Baked', 'Farm To Fam', 'SWEETSPOT', 'Dab FX+', 'Northeast Alternatives',
+    'Higher Celebrations', 'NEA Pride Jays', ''
+]
+RETAIL_CATEGORIES = ['NEA Flower', 'NEA MIPs']
+EXCLUDED_BUYERS = [  # NEA's own retail stores, already counted in retail sales
+    'northeast alternatives - fall river',
+    'near / northeast alternatives retail, llc - seekonk',
+    'near / northeast alternatives retail, llc - new bedford',
+]
+
+# ---------------------- Query Builder ----------------------
+# Each extract is declared once (view, projection, fixed filters, grouping, brand gate) and the
+# SQL is generated from it. Values always travel as bind parameters (%s, pyformat), never f-strings.
+
+Filter = namedtuple("Filter", ["sql", "params"])
+Extract = namedtuple("Extract", ["view", "columns", "filters", "group_by", "brand_gate"])
+
+def where(sql: str, *params) -> Filter:
+    return Filter(sql, tuple(params))
+
+def in_list(expr: str, values, negate: bool = False) -> Filter:
+    placeholders = ", ".join(["%s"] * len(values))
+    return Filter(f"{expr} {'NOT IN' if negate else 'IN'} ({placeholders})", tuple(values))
+
+def between(expr: str, start, end) -> Filter:
+    return Filter(f"{expr} BETWEEN %s AND %s", (start, end))
+
+def latest(expr: str, view: str) -> Filter:
+    """Only the most recent `expr` snapshot in `view`."""
+    return Filter(f"{expr} = (SELECT MAX({expr}) FROM {view})", ())
+
+def build_query(extract: Extract, *filters: Filter, columns=None, group_by=None):
+    """
+    (sql, params) for `extract` with its declared filters plus any runtime `filters` (date windows).
+    `columns` / `group_by` replace the declared projection, e.g. for audit counts.
+    """
+    if columns is None:
+        columns, group_by = extract.columns, extract.group_by
+    filters = list(extract.filters) + list(filters)
+
+    sql = "SELECT\n    " + ",\n    ".join(columns) + f"\nFROM {extract.view}"
+    if filters:
+        sql += "\nWHERE " + "\n  AND ".join(f.sql for f in filters)
+    if group_by:
+        sql += "\nGROUP BY " + ", ".join(group_by)
+    params = tuple(p for f in filters for p in f.params)
+    return sql, params
+
+def output_columns(extract: Extract):
+    """Result column names of the declared projection (alias when given)."""
+    return [c.split(" AS ")[-1].strip().strip('"') for c in extract.columns]
+
+# ---------------------- Brand Gate ----------------------
+
+def brand_filter(extract: Extract, approved: bool = True) -> Filter:
+    """Approved brands only, or (approved=False) the wrong-brand complement including NULL brands."""
+    expr, values = extract.brand_gate
+    if approved:
+        return in_list(expr, values)
+    deny = in_list(expr, values, negate=True)
+    return Filter(f"({expr} IS NULL OR {deny.sql})", deny.params)
+
+def fetch_wrong_brands(cursor, extract: Extract, *filters: Filter, stage: str = "") -> pd.DataFrame:
+    """
+    Wrong-brand rows for the unmatched audit output. With WRONG_BRAND_DETAIL=0 only per-brand
+    source row counts are pulled and logged, and an empty frame with the extract's columns is returned.
+    """
+    if WRONG_BRAND_DETAIL:
+        cursor.execute(*build_query(extract, *filters, brand_filter(extract, approved=False)), timeout=QUERY_TIMEOUT)
+        return fetch_frame(cursor)
+
+    cursor.execute(*build_query(extract, *filters, brand_filter(extract, approved=False),
+                                columns=["BRANDNAME", "COUNT(*) AS SOURCE_ROWS"], group_by=["BRANDNAME"]),
+                   timeout=QUERY_TIMEOUT)
+    counts = fetch_frame(cursor)
+    if not counts.empty:
+        log.info("🚫 %s wrong-brand source rows (not pulled): %s", stage, ", ".join(
+            f"{b}={n}" for b, n in counts.sort_values("SOURCE_ROWS", ascending=False).itertuples(index=False)))
+    return pd.DataFrame(columns=output_columns(extract))
+
+# ---------------------- Extracts ----------------------
+
+_RETAIL_DIMENSIONS = ['LOCATIONNAME', 'PRODUCTID', 'PRODUCTNAME', 'SKU', 'MASTERCATEGORY', 'BRANDNAME', 'PRODUCTGRAMS', 'CATEGORY']
+
+EXTRACTS = {
+    # + between("TRANSACTIONDATE", start, end)
+    'retail_sales': Extract(
+        view="NEA_SALES.PUBLIC.VSALES",
+        columns=_RETAIL_DIMENSIONS[:7] + [
+            'SUM(PRODUCTGRAMS) AS WEIGHTSOLD',
+            'CATEGORY',
+            'TRANSACTIONDATE',
+            'COUNT(DISTINCT TRANSACTIONID) AS TOTAL_TRANSACTIONS',
+            'SUM(QUANTITY) AS TOTAL_QUANTITY',
+            'SUM(NETSALEFORITEM) AS TOTAL_REVENUE',
+            'AVG(UNITCOST) AS AVG_UNIT_COST',
+        ],
+        filters=[
+            where("TRANSACTIONTYPE ILIKE %s", 'Retail'),
+            in_list("MASTERCATEGORY", RETAIL_CATEGORIES),
+            where("RETURNDATE IS NULL"),
+            where("ISVOID = 'false'"),
+        ],
+        group_by=_RETAIL_DIMENSIONS + ['TRANSACTIONDATE'],
+        brand_gate=("LOWER(TRIM(BRANDNAME))", [b.lower() for b in APPROVED_BRANDS]),
+    ),
+    'retail_inventory': Extract(
+        view="NEA_SALES.PUBLIC.VRETAILINVENTORY",
+        columns=_RETAIL_DIMENSIONS + ['QUANTITYAVAILABLE', 'INVENTORYDATE'],
+        filters=[
+            latest("INVENTORYDATE", "NEA_SALES.PUBLIC.VRETAILINVENTORY"),
+            where("QUANTITYAVAILABLE IS NOT NULL"),
+            in_list("MASTERCATEGORY", RETAIL_CATEGORIES),
+            where("QUANTITYAVAILABLE > 0"),
+        ],
+        group_by=[],
+        brand_gate=("BRANDNAME", APPROVED_BRANDS),
+    ),
+    # + between("DELIVERYDATE", start, end)
+    'wholesale_sales': Extract(
+        view="NEA_SALES.WHOLESALE.VWHOLESALESALES",
+        columns=[
+            "'Wholesale' AS LOCATIONNAME",
+            'DELIVERYDATE AS TRANSACTIONDATE',
+            'PRODUCTNAME',
+            'BRAND AS BRANDNAME',
+            'PRODUCTSKU',
+            'WEIGHTUNIT',
+            'UNITSPERCASE',
+            'PRODUCTSKU AS "S&OP Category"',
+            'BUYERNAME',
+            'SUM(QUANTITY) AS QUANTITY',
+            'SUM(LINETOTAL) AS TOTAL_REVENUE',
+        ],
+        filters=[in_list("LOWER(BUYERNAME)", EXCLUDED_BUYERS, negate=True)],
+        group_by=['DELIVERYDATE', 'PRODUCTNAME', 'BRAND', 'PRODUCTSKU', 'WEIGHTUNIT', 'UNITSPERCASE', 'BUYERNAME'],
+        brand_gate=None,
+    ),
+    'wholesale_inventory': Extract(
+        view="NEA_SALES.WHOLESALE.VWHOLESALEPRODUCTS",
+        columns=[
+            "'Wholesale' AS LOCATIONNAME",
+            'PRODUCTNAME',
+            'BRAND AS BRANDNAME',
+            'PRODUCTSKU',
+            'UNITSIZE AS WEIGHTUNIT',
+            'UNITSPERCASE',
+            'INVENTORYDATE',
+            'QUANTITY AS QUANTITYONHAND',
+        ],
+        filters=[
+            latest("INVENTORYDATE", "NEA_SALES.WHOLESALE.VWHOLESALEPRODUCTS"),
+            where("QUANTITY IS NOT NULL"),
+            where("QUANTITY > 0"),
+            where("PRODUCTARCHIVED = false"),
+        ],
+        group_by=[],
+        brand_gate=None,
+    ),
+}
@@ -0,0 +1,171 @@
+import glob
+import os
+import re
+import threading
+import duckdb
+import pyarrow as pa
+from pipeline_log import get_logger
+
+log = get_logger("local")
+
+# ——— PARAMETERS ———
+# PIPELINE_BACKEND=local (snowflake_sessions.py) connects every profile here instead of Snowflake.
+# Fixtures are laid out like the warehouse, <LOCAL_FIXTURE_DIR>/<DATABASE>/<SCHEMA>/<VIEW>.parquet
+# (or .csv), e.g. NEA_SALES/PUBLIC/VSALES.parquet or NEA_FORECASTING/PUBLIC/PRODUCT_CATALOG.parquet,
+# and exposed as views under the same three-part names, so the extract SQL runs unchanged.
+# Each database is a DuckDB file in LOCAL_DB_DIR; uploaded tables persist there between runs.
+LOCAL_DB_DIR      = os.getenv("LOCAL_DB_DIR", "local_db")
+LOCAL_FIXTURE_DIR = os.getenv("LOCAL_FIXTURE_DIR", os.path.join(LOCAL_DB_DIR, "fixtures"))
+
+# ---------------------- Snowflake SQL Dialect ----------------------
+# Only the statements the pipeline itself issues. Temporary tables become regular tables because
+# DuckDB temp tables are per-cursor and the pipeline's cursors share them (they are dropped anyway).
+
+_STAGE   = re.compile(r"\s*CREATE TEMPORARY STAGE", re.I)
+_SESSION = re.compile(r"\s*ALTER SESSION", re.I)
+_LIKE    = re.compile(r"\s*CREATE TEMPORARY TABLE (\w+) LIKE (\w+)\s*$", re.I)
+_PUT     = re.compile(r"\s*PUT 'file://(.+?)' @(\S+)", re.I)
+_COPY    = re.compile(r"\s*COPY INTO (\w+) FROM @(\S+)", re.I)
+_CLONE   = re.compile(r"\s*CREATE OR REPLACE TABLE (\w+) CLONE (\w+)", re.I)
+_SWAP    = re.compile(r"\s*ALTER TABLE (\w+) SWAP WITH (\w+)", re.I)
+_REWRITES = [
+    (re.compile(r"HASH_AGG\(\*\)\s+FROM\s+(\w+)", re.I), r"BIT_XOR(HASH(\1)) FROM \1"),
+    (re.compile(r"CURRENT_VERSION\(\)", re.I), "VERSION()"),
+]
+
+class LocalConnection:
+    """DuckDB stand-in for a Snowflake connection: cursor(), close(), is_closed()."""
+
+    def __init__(self, database: str, schema: str):
+        os.makedirs(LOCAL_DB_DIR, exist_ok=True)
+        self.database, self.schema = database.upper(), schema.upper()
+        self.db = duckdb.connect(os.path.join(LOCAL_DB_DIR, f"{self.database}.duckdb"))
+        self.staged = {}   # stage location -> Parquet files PUT there
+        self.pending = {}  # shadow table -> target it was created LIKE, before the target exists
+        self._lock = threading.Lock()
+        self._closed = False
+        self.db.execute(f"CREATE SCHEMA IF NOT EXISTS {self.schema}")
+        self._attach_fixtures()
+
+    def _attach_fixtures(self):
+        tables = {(s.upper(), t.upper()) for s, t in self.db.execute(
+            "SELECT schema_name, table_name FROM duckdb_tables()").fetchall()}
+        root = os.path.join(LOCAL_FIXTURE_DIR, self.database)
+        for path in sorted(glob.glob(os.path.join(root, "*", "*.parquet")) + glob.glob(os.path.join(root, "*", "*.csv"))):
+            schema = os.path.basename(os.path.dirname(path)).upper()
+            view = os.path.splitext(os.path.basename(path))[0].upper()
+            if (schema, view) in tables:  # an uploaded table of that name wins over its fixture
+                continue
+            reader = "read_parquet" if path.endswith(".parquet") else "read_csv_auto"
+            self.db.execute(f"CREATE SCHEMA IF NOT EXISTS {schema}")
+            self.db.execute(f"CREATE OR REPLACE VIEW {schema}.{view} AS SELECT * FROM {reader}('{os.path.abspath(path)}')")
+        log.debug("Local backend %s opened (fixtures: %s)", self.database, root)
+
+    def cursor(self):
+        return LocalCursor(self)
+
+    def close(self):
+        if not self._closed:
+            self.db.close()
+            self._closed = True
+
+    def is_closed(self):
+        return self._closed
+
+class LocalCursor:
+    """Cursor with the Snowflake methods the pipeline uses (execute(timeout=), fetch_pandas_*)."""
+
+    def __init__(self, conn: LocalConnection):
+        self.conn = conn
+        self.cur = conn.db.cursor()  # one DuckDB connection per cursor, safe across extract threads
+        self.cur.execute(f"USE {conn.database}.{conn.schema}")
+        self.description = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.cur.close()
+
+    def execute(self, sql: str, params=None, timeout=None):
+        """`timeout` is accepted for call compatibility; local queries are not cancelled."""
+        self.description = None
+        if _STAGE.match(sql) or _SESSION.match(sql):
+            return self
+        for pattern, handler in ((_LIKE, self._like), (_PUT, self._put), (_COPY, self._copy),
+                                 (_CLONE, self._clone), (_SWAP, self._swap)):
+            m = pattern.match(sql)
+            if m:
+                handler(*m.groups())
+                return self
+        for pattern, repl in _REWRITES:
+            sql = pattern.sub(repl, sql)
+        if params:  # pyformat (%s) -> DuckDB positional (?)
+            sql = sql.replace("%s", "?").replace("%%", "%")
+        self.cur.execute(sql, list(params) if params else None)
+        self.description = self.cur.description
+        return self
+
+    # --- Snowflake-only statements ---
+
+    def _like(self, table, target):
+        if self._exists(target):
+            self.cur.execute(f"CREATE TABLE {table} AS SELECT * FROM {target} WHERE FALSE")
+        else:  # first upload: the target takes the schema of the first staged files (see _copy)
+            self.cur.execute(f"CREATE TABLE {table} (_PENDING INTEGER)")
+            self.conn.pending[table.upper()] = target
+
+    def _put(self, pattern, location):
+        self.conn.staged[location.rstrip("/")] = sorted(glob.glob(pattern))
+
+    def _copy(self, table, location):
+        source = f"read_parquet({self.conn.staged.pop(location.rstrip('/'))!r})"
+        target = self.conn.pending.pop(table.upper(), None)
+        if target is not None:
+            self.cur.execute(f"CREATE TABLE {target} AS SELECT * FROM {source} WHERE FALSE")
+            self.cur.execute(f"CREATE OR REPLACE TABLE {table} AS SELECT * FROM {target} WHERE FALSE")
+        self.cur.execute(f"INSERT INTO {table} BY NAME SELECT * FROM {source}")
+
+    def _clone(self, table, source):
+        self.cur.execute(f"CREATE OR REPLACE TABLE {table} AS SELECT * FROM {source}")
+
+    def _swap(self, a, b):
+        with self.conn._lock:
+            self.cur.execute("BEGIN")
+            self.cur.execute(f"ALTER TABLE {a} RENAME TO {a}__SWAP")
+            self.cur.execute(f"ALTER TABLE {b} RENAME TO {a}")
+            self.cur.execute(f"ALTER TABLE {a}__SWAP RENAME TO {b}")
+            self.cur.execute("COMMIT")
+
+    def _exists(self, table):
+        return self.cur.execute(
+            "SELECT COUNT(*) FROM duckdb_tables() WHERE database_name = ? AND schema_name = ? AND UPPER(table_name) = ?",
+            [self.conn.database, self.conn.schema, table.upper()]).fetchone()[0] > 0
+
+    # --- Fetch ---
+
+    def fetchone(self):
+        return self.cur.fetchone()
+
+    def fetchall(self):
+        return self.cur.fetchall()
+
+    def fetchmany(self, size):
+        return self.cur.fetchmany(size)
+
+    def fetch_pandas_all(self):
+        return self.cur.fetch_df()
+
+    def fetch_pandas_batches(self, rows: int = 10_000):  # about one Snowflake result chunk
+        reader = self.cur.fetch_record_batch(rows)
+        for batch in reader:
+            yield pa.Table.from_batches([batch]).to_pandas()
+
+# ---------------------- Connect ----------------------
+
+def connect(user=None, password=None, account=None, database="NEA_FORECASTING", schema="PUBLIC", **_):
+    """Same keyword arguments as snowflake.connector.connect; credentials and warehouse are ignored."""
+    return LocalConnection(database, schema)
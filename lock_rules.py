@@ -0,0 +1,266 @@
+import numpy as np
+from rapidfuzz import fuzz
+from reference_index import RefFeatures, PACK_PATTERN, brand_family
+
+# ---------------------- Feature Arrays ----------------------
+# Every lock is evaluated as a boolean mask over a (rows × candidates) matrix of
+# reference indices: row features broadcast down the columns, reference features
+# are gathered by candidate index. Candidate index -1 (padding, or "no candidate")
+# resolves to a blank reference appended after the real ones.
+
+GRAMS_CHECK_TYPES = ['flower', 'concentrate', 'vape', 'preroll']
+PREGROUND_MARKERS = ['preground', '7g', 'bulk', 'ounce']
+REF_FLAGS = (
+    'has_category', 'cat_preroll', 'cat_infused', 'cat_concentrate', 'cat_flower', 'cat_vape',
+    'cat_nea', 'cat_nea_fire', 'cat_nea_premium', 'cat_nea_awarded', 'cat_valorem',
+)
+
+BLANK_REF = RefFeatures(
+    name=None, category="", has_category=False, grams=None, flavors=[], flavor_set=frozenset(),
+    flavor_str="", strain=None, pack=None, cat_preroll=False, cat_infused=False,
+    cat_concentrate=False, cat_flower=False, cat_vape=False, cat_nea=False, cat_nea_fire=False,
+    cat_nea_premium=False, cat_nea_awarded=False, cat_valorem=False,
+)
+
+def _objects(values):
+    out = np.empty(len(values), dtype=object)
+    for i, v in enumerate(values):
+        out[i] = v
+    return out
+
+def _truthy(values):
+    # the scalar rules test `not value`, so NaN counts as present and 0 / None as missing
+    return np.fromiter((bool(v) for v in values), dtype=bool, count=len(values))
+
+def _floats(values):
+    return np.array([np.nan if v is None else float(v) for v in values], dtype=float)
+
+def _flags(values, test):
+    return np.fromiter((test(v) for v in values), dtype=bool, count=len(values))
+
+def reference_arrays(ref_list):
+    """Column arrays over the reference feature table (same order as reference_names) plus the blank reference."""
+    refs = list(ref_list) + [BLANK_REF]
+    arrays = {flag: _flags(refs, lambda r, f=flag: bool(getattr(r, f))) for flag in REF_FLAGS}
+    grams = [r.grams for r in refs]
+    strains = [r.strain for r in refs]
+    packs = [r.pack for r in refs]
+    arrays.update(
+        grams_set=_truthy(grams), grams=_floats(grams),
+        strain_set=_truthy(strains), strain=_objects(strains),
+        pack_set=_truthy(packs), pack=_objects(packs),
+        features=refs,
+    )
+    return arrays
+
+def reference_count(refs):
+    return len(refs['features']) - 1
+
+def row_arrays(data):
+    """
+    Per-row feature arrays. `data` is the frame being matched or any mapping of its
+    columns; name features are only built when PRODUCTNAME is present, so blocking
+    keys (type, brand, grams, strain) can be evaluated on their own.
+    """
+    p_type = _objects(list(data['ProductType']))
+    grams = list(data['PRODUCTGRAMS'])
+    strains = list(data['StrainType'])
+    rows = {
+        'flower': p_type == 'flower',
+        'concentrate': p_type == 'concentrate',
+        'edible': p_type == 'edible',
+        'grams_type': _flags(p_type, lambda t: t in GRAMS_CHECK_TYPES),
+        'grams_set': _truthy(grams), 'grams': _floats([g if g else None for g in grams]),
+        'strain_set': _truthy(strains), 'strain': _objects(strains),
+        'family': _objects([brand_family(b) for b in data['BRANDNAME']]),
+    }
+    if 'PRODUCTNAME' in data:
+        pn = [str(v).lower() for v in data['PRODUCTNAME']]
+        packs = [PACK_PATTERN.search(p) for p in pn]
+        rows.update(
+            pn_pr=_flags(pn, lambda p: 'pr' in p),
+            pn_preroll=_flags(pn, lambda p: 'preroll' in p),
+            pn_infused=_flags(pn, lambda p: 'infused' in p),
+            pn_preground=_flags(pn, lambda p: any(x in p for x in PREGROUND_MARKERS)),
+            pack_set=_flags(packs, lambda m: m is not None),
+            pack=_objects([m.group(1) if m else None for m in packs]),
+            flavors=list(data['FlavorTokens']),
+            flavor_str=list(data['FlavorCleaned']),
+        )
+    return rows
+
+def candidate_matrix(candidate_lists):
+    """(rows × k) reference indices and scores from per-row [(name, score, index)] lists, padded with -1 / -inf."""
+    width = max((len(c) for c in candidate_lists), default=0)
+    cand = np.full((len(candidate_lists), width), -1, dtype=np.intp)
+    scores = np.full((len(candidate_lists), width), -np.inf)
+    for r, cands in enumerate(candidate_lists):
+        for k, (_, score, j) in enumerate(cands):
+            cand[r, k] = j
+            scores[r, k] = score
+    return cand, scores
+
+# ---------------------- Lock Rules ----------------------
+# Each rule returns True where the candidate passes, mirroring the scalar lock of
+# the same name in retail_cleaning.py (sales) / retail_inventory_cleaning.py (inventory).
+
+def _col(rows, key):
+    return rows[key][:, None]
+
+def grams_check(rows, refs, cand):
+    pg, mg = _col(rows, 'grams'), refs['grams'][cand]
+    skip = ~_col(rows, 'grams_set') | ~refs['grams_set'][cand] | ~_col(rows, 'grams_type')
+    # bulk (>7g) never matches small packs (<=3.5g); otherwise grams must agree within 0.05
+    size_clash = ((pg > 7) & (mg <= 3.5)) | ((mg > 7) & (pg <= 3.5))
+    return skip | (~size_clash & (np.abs(pg - mg) <= 0.05))
+
+def strain_check(rows, refs, cand):
+    both = _col(rows, 'strain_set') & refs['strain_set'][cand]
+    return ~both | (_col(rows, 'strain') == refs['strain'][cand])
+
+def infused_lock(rows, refs, cand):
+    return _col(rows, 'pn_infused') == refs['cat_infused'][cand]
+
+def preground_lock(rows, refs, cand):
+    return ~(_col(rows, 'pn_preground') & refs['cat_preroll'][cand])
+
+def _brand_lock(allowed):
+    def lock(rows, refs, cand):
+        family = _col(rows, 'family')
+        ok = ~refs['has_category'][cand] | (family == '')
+        for name, flags in allowed.items():
+            in_family = np.zeros(cand.shape, dtype=bool)
+            for flag in flags:
+                in_family |= refs[flag][cand]
+            ok |= (family == name) & in_family
+        return ok
+    return lock
+
+# sales: product names mentioning "pr" never match concentrate or vape categories
+def sales_pr_lock(rows, refs, cand):
+    named = _col(rows, 'pn_pr') | _col(rows, 'pn_preroll')
+    return ~(named & (refs['cat_concentrate'][cand] | refs['cat_vape'][cand]))
+
+# sales: flower needs a strain on both sides, and they must agree
+def sales_strain_strict_lock(rows, refs, cand):
+    both = _col(rows, 'strain_set') & refs['strain_set'][cand]
+    return ~_col(rows, 'flower') | (both & (_col(rows, 'strain') == refs['strain'][cand]))
+
+sales_brand_lock = _brand_lock({
+    'nea fire': ('cat_nea_fire',), 'nea awarded': ('cat_nea_awarded',),
+    'nea premium': ('cat_nea_premium',), 'valorem': ('cat_valorem',),
+})
+
+# inventory: preroll categories only match products named as prerolls
+def inventory_pr_lock(rows, refs, cand):
+    return ~(refs['cat_preroll'][cand] & ~_col(rows, 'pn_preroll'))
+
+# inventory: flower strains only conflict when both sides name one
+def inventory_strain_strict_lock(rows, refs, cand):
+    return ~_col(rows, 'flower') | strain_check(rows, refs, cand)
+
+inventory_brand_lock = _brand_lock({
+    'nea fire': ('cat_nea_fire', 'cat_nea'), 'valorem': ('cat_valorem',),
+    'nea premium': ('cat_nea',), 'nea awarded': ('cat_nea',),
+})
+
+def category_type_conflict_lock(rows, refs, cand):
+    return ~(_col(rows, 'flower') & refs['cat_concentrate'][cand]) & \
+           ~(_col(rows, 'concentrate') & refs['cat_flower'][cand])
+
+# inventory: prerolls need the same "(Npk)" pack size, or no pack size on either side
+def packaging_lock(rows, refs, cand):
+    p_set, m_set = _col(rows, 'pack_set'), refs['pack_set'][cand]
+    same = (p_set & m_set & (_col(rows, 'pack') == refs['pack'][cand])) | (~p_set & ~m_set)
+    return ~_col(rows, 'pn_preroll') | same
+
+PROFILE_RULES = {
+    'retail_sales': {
+        'grams_check': grams_check,
+        'pr_lock': sales_pr_lock,
+        'infused_lock': infused_lock,
+        'strain_check': strain_check,
+        'preground_lock': preground_lock,
+        'brand_lock': sales_brand_lock,
+        'strain_strict_lock': sales_strain_strict_lock,
+    },
+    'retail_inventory': {
+        'pr_lock': inventory_pr_lock,
+        'type_conflict': category_type_conflict_lock,
+        'packaging': packaging_lock,
+        'grams_check': grams_check,
+        'infused_lock': infused_lock,
+        'strain_check': strain_check,
+        'preground_lock': preground_lock,
+        'brand_lock': inventory_brand_lock,
+        'strain_strict_lock': inventory_strain_strict_lock,
+    },
+}
+
+# locks that depend only on (product type, brand family, grams, strain), used for candidate blocking
+BLOCK_RULES = {
+    'retail_sales': ('grams_check', 'brand_lock', 'strain_check', 'strain_strict_lock'),
+    'retail_inventory': ('type_conflict', 'grams_check', 'brand_lock', 'strain_check', 'strain_strict_lock'),
+}
+
+# ---------------------- Rule Engine ----------------------
+
+def rule_masks(profile, rows, refs, cand, rules=None):
+    """{rule name: pass mask} for the profile's locks (all of them, or just `rules`, in that order)."""
+    table = PROFILE_RULES[profile]
+    with np.errstate(invalid='ignore'):
+        return {name: table[name](rows, refs, cand) for name in (rules or table)}
+
+def passes_rules(profile, rows, refs, cand, rules=None):
+    ok = np.ones(cand.shape, dtype=bool)
+    for mask in rule_masks(profile, rows, refs, cand, rules).values():
+        ok &= mask
+    return ok
+
+def flavor_check(rows, refs, cand, valid):
+    """
+    Edibles also need a flavor match: two shared flavor tokens, or a flavor string
+    ratio of 85+. Set overlap and fuzz.ratio run per cell, only where every other
+    rule already passed.
+    """
+    features = refs['features']
+    for r, k in zip(*np.nonzero(valid & _col(rows, 'edible'))):
+        ref = features[cand[r, k]]
+        if not ref.flavors:
+            valid[r, k] = False
+        elif len(ref.flavor_set.intersection(rows['flavors'][r])) < 2:
+            valid[r, k] = fuzz.ratio(rows['flavor_str'][r], ref.flavor_str) >= 85
+    return valid
+
+def strict_rule_mask(profile, rows, refs, cand, scores, threshold):
+    """Candidates that clear the score threshold and every lock of the profile."""
+    valid = (cand >= 0) & (scores >= threshold)
+    valid &= passes_rules(profile, rows, refs, cand)
+    return flavor_check(rows, refs, cand, valid)
+
+def best_valid_matches(cand, scores, valid, reference_names, product_names, tiebreak):
+    """
+    Per row, the (reference name, score) `tiebreak` picks among the valid candidates
+    with the top score, or None. Lower-scored candidates can never win the
+    (score, partial_ratio) sort, so only the tied ones are handed over.
+    """
+    out = []
+    for r in range(len(cand)):
+        cols = np.flatnonzero(valid[r])
+        if not len(cols):
+            out.append(None)
+            continue
+        top = scores[r, cols].max()
+        tied = [(reference_names[cand[r, k]], float(scores[r, k])) for k in cols if scores[r, k] == top]
+        out.append(tiebreak(tied, product_names[r]) if len(tied) > 1 else tied[0])
+    return out
+
+def block_mask(profile, key, refs):
+    """Boolean mask over all references for one (product type, brand, grams, strain) blocking key."""
+    p_type, brand, p_grams, p_strain = key
+    rows = row_arrays({
+        'ProductType': [p_type], 'BRANDNAME': [brand],
+        'PRODUCTGRAMS': [p_grams], 'StrainType': [p_strain],
+    })
+    every = np.arange(reference_count(refs))[None, :]
+    return passes_rules(profile, rows, refs, every, BLOCK_RULES[profile])[0]
@@ -0,0 +1,88 @@
+import hashlib
+import json
+import os
+import sqlite3
+import pandas as pd
+
+# ——— PARAMETERS ———
+# Lives next to the Match_Archive folder; override with MATCH_CACHE_PATH (the workflow does).
+MATCH_CACHE_PATH = os.getenv(
+    "MATCH_CACHE_PATH",
+    os.path.join(r"C:\Users\Mitch\OneDrive\Desktop\Consulting\Vitalis Files\NEA", "match_cache.sqlite")
+)
+CACHE_RULES_VERSION = 1  # bump whenever lock rules change so old results are not reused
+
+# ---------------------- Keys ----------------------
+
+def catalog_fingerprint(catalog_df: pd.DataFrame) -> str:
+    """Content hash of the product catalog (columns + values); changes whenever the catalog does."""
+    h = hashlib.sha256()
+    h.update("|".join(map(str, catalog_df.columns)).encode("utf-8"))
+    h.update(pd.util.hash_pandas_object(catalog_df.astype(str), index=False).to_numpy().tobytes())
+    return h.hexdigest()
+
+def match_cache_keys(frame: pd.DataFrame, keys) -> list:
+    """One stable string per row built from the match-key columns (nulls collapse to None)."""
+    values = frame[keys].astype(object).where(frame[keys].notna(), None)
+    return [json.dumps(list(v), default=lambda o: o.item()) for v in values.itertuples(index=False, name=None)]
+
+# ---------------------- Cache ----------------------
+
+class MatchCache:
+    """
+    Persistent per-product match results, scoped to a rule profile and a catalog hash.
+    Entries written against any other catalog hash are dropped when the cache is opened.
+    """
+
+    def __init__(self, profile: str, catalog_hash: str, path: str = MATCH_CACHE_PATH):
+        self.profile = f"{profile}/v{CACHE_RULES_VERSION}"
+        self.catalog_hash = catalog_hash
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS match_cache (
+                profile      TEXT NOT NULL,
+                match_key    TEXT NOT NULL,
+                catalog_hash TEXT NOT NULL,
+                result       TEXT NOT NULL,
+                PRIMARY KEY (profile, match_key)
+            )
+        """)
+        self.conn.execute(
+            "DELETE FROM match_cache WHERE profile = ? AND catalog_hash != ?",
+            (self.profile, self.catalog_hash)
+        )
+        self.conn.commit()
+        rows = self.conn.execute(
+            "SELECT match_key, result FROM match_cache WHERE profile = ?", (self.profile,)
+        ).fetchall()
+        self._entries = {k: tuple(json.loads(r)) for k, r in rows}
+
+    def get_many(self, keys) -> dict:
+        found = {k: self._entries[k] for k in keys if k in self._entries}
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, results: dict):
+        if not results:
+            return
+        rows = [
+            (self.profile, k, self.catalog_hash, json.dumps(list(v), default=lambda o: o.item()))
+            for k, v in results.items()
+        ]
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO match_cache (profile, match_key, catalog_hash, result) VALUES (?, ?, ?, ?)",
+            rows
+        )
+        self.conn.commit()
+        self._entries.update(results)
+
+    def summary(self) -> str:
+        return (f"Match cache [{self.profile}]: {self.hits} hits, {self.misses} misses "
+                f"(catalog {self.catalog_hash[:12]})")
+
+    def close(self):
+        self.conn.close()
@@ -1,18 +1,21 @@
-import os
+import time
 import pandas as pd
-import snowflake.connector
-from snowflake.connector.pandas_tools import write_pandas
+from snowflake_upsert import upsert_partitions, date_scope
 
-from retail_inventory_cleaning import run_retail_inventory_cleaning
-from wholesale_inventory_cleaning import run_wholesale_inventory_cleaning
+from pipeline_log import get_logger, debug_enabled, stage_summary
+from snowflake_sessions import get_connection
 
-# --- Snowflake (target) ---
-SF_USER = os.getenv("MY_SF_USER")
-SF_PASS = os.getenv("MY_SF_PASS")
-SF_ACCOUNT = os.getenv("MY_SF_ACCT")
-SF_WAREHOUSE = "COMPUTE_WH"
-SF_DATABASE = "NEA_FORECASTING"
-SF_SCHEMA = "PUBLIC"
+log = get_logger("merge_inventory")
+
+# --- Snowflake (target): shared MY_SF_* session, NEA_FORECASTING.PUBLIC (snowflake_sessions.py) ---
+
+# rows each source owns in the inventory tables
+SOURCE_FILTERS = {
+    'retail_inventory': "COALESCE(LOCATIONNAME, '') <> 'Wholesale'",
+    'wholesale_inventory': "LOCATIONNAME = 'Wholesale'",
+}
+
+UPSERT_KEYS = ['LOCATIONNAME', 'INVENTORYDATE', 'PRODUCTNAME']
 
 # ---------- Helpers ----------
 def harmonize_wholesale_columns(df: pd.DataFrame) -> pd.DataFrame:
@@ -34,96 +37,83 @@ def split_matched_unmatched(df: pd.DataFrame):
     cond = df["Matched S&OP Category"].notna() & (df["Matched S&OP Category"].astype(str).str.strip() != "")
     return df[cond].copy(), df[~cond].copy()
 
-def align_columns(df1: pd.DataFrame, df2: pd.DataFrame):
-    """Align columns but ensure TOTAL_QUANTITY is preserved"""
-    print(f"🔍 DEBUG align_columns:")
-    print(f"   df1 columns: {list(df1.columns)}")
-    print(f"   df2 columns: {list(df2.columns)}")
-    
-    common = list(set(df1.columns).intersection(df2.columns))
-    print(f"   Common columns: {common}")
-    
-    # Ensure TOTAL_QUANTITY is included if it exists in either DataFrame
-    if 'TOTAL_QUANTITY' in df1.columns and 'TOTAL_QUANTITY' not in common:
-        print("⚠️ TOTAL_QUANTITY missing from df2, adding with NaN")
-        df2['TOTAL_QUANTITY'] = None
-        common.append('TOTAL_QUANTITY')
-    if 'TOTAL_QUANTITY' in df2.columns and 'TOTAL_QUANTITY' not in common:
-        print("⚠️ TOTAL_QUANTITY missing from df1, adding with NaN")
-        df1['TOTAL_QUANTITY'] = None
-        common.append('TOTAL_QUANTITY')
-    
-    print(f"   Final aligned columns: {common}")
-    return df1[common].copy(), df2[common].copy()
+# the columns retail and wholesale inventory outputs share; every source is cut to them, so a run
+# where one source failed uploads the same shape as a full one (see merge_outputs.OUTPUT_COLUMNS)
+OUTPUT_COLUMNS = ['LOCATIONNAME', 'INVENTORYDATE', 'PRODUCTNAME', 'BRANDNAME', 'TOTAL_QUANTITY',
+                  'Matched S&OP Category', 'Matched Reference', 'Match Score', 'Match Result']
+
+def align_columns(*frames):
+    """Project each frame onto OUTPUT_COLUMNS; a column a source lacks (e.g. TOTAL_QUANTITY) is added as NaN"""
+    aligned = []
+    for df in frames:
+        missing = [c for c in OUTPUT_COLUMNS if c not in df.columns]
+        if missing:
+            log.warning("⚠️ %s missing from an inventory source, adding with NaN", ", ".join(missing))
+        aligned.append(df.reindex(columns=OUTPUT_COLUMNS))
+    log.debug("Final aligned columns: %s", OUTPUT_COLUMNS)
+    return aligned
 
 def upload_to_snowflake(df: pd.DataFrame, table_name: str):
-    print(f"\n🔍 DEBUG - Uploading {table_name}:")
-    print(f"   DataFrame shape: {df.shape}")
-    print(f"   DataFrame columns: {list(df.columns)}")
+    log.debug("Uploading %s: shape %s, columns %s", table_name, df.shape, list(df.columns))
     
     df = df.copy()
     if "TOTAL_QUANTITY" in df.columns:
-        print(f"✅ TOTAL_QUANTITY found")
-        print(f"   Before conversion: sum={df['TOTAL_QUANTITY'].sum()}, nulls={df['TOTAL_QUANTITY'].isna().sum()}")
+        if debug_enabled(log):
+            log.debug("TOTAL_QUANTITY before conversion: sum=%s, nulls=%s",
+                      df['TOTAL_QUANTITY'].sum(), df['TOTAL_QUANTITY'].isna().sum())
         df["TOTAL_QUANTITY"] = pd.to_numeric(df["TOTAL_QUANTITY"], errors="coerce").astype(float)
-        print(f"   After conversion: sum={df['TOTAL_QUANTITY'].sum()}, nulls={df['TOTAL_QUANTITY'].isna().sum()}")
+        if debug_enabled(log):
+            log.debug("TOTAL_QUANTITY after conversion: sum=%s, nulls=%s",
+                      df['TOTAL_QUANTITY'].sum(), df['TOTAL_QUANTITY'].isna().sum())
     else:
-        print(f"❌ TOTAL_QUANTITY column missing!")
-
-    conn = snowflake.connector.connect(
-        user=SF_USER, password=SF_PASS, account=SF_ACCOUNT,
-        warehouse=SF_WAREHOUSE, database=SF_DATABASE, schema=SF_SCHEMA
-    )
-    try:
-        # Clear just the snapshot dates we're about to load
-        if "INVENTORYDATE" in df.columns and not df.empty:
-            dates = sorted(set(pd.to_datetime(df["INVENTORYDATE"]).dt.strftime("%Y-%m-%d")))
-            if dates:
-                in_list = ",".join([f"TO_DATE('{d}')" for d in dates])
-                conn.cursor().execute(f"DELETE FROM {table_name} WHERE INVENTORYDATE IN ({in_list});")
-                print(f"🔄 Cleared {table_name} for snapshot(s): {', '.join(dates)}")
-
-        success, nchunks, nrows, _ = write_pandas(conn, df, table_name.upper())
-        print(f"✅ Uploaded to {table_name}: {nrows} rows")
-    finally:
-        conn.close()
+        log.warning("❌ TOTAL_QUANTITY column missing!")
 
-# ---------- Main ----------
-if __name__ == "__main__":
-    print("🧩 Running retail & wholesale inventory cleaners...")
-
-    # Debug: Check what the cleaners return
-    print("🔍 Running retail inventory cleaner...")
-    retail_matched, retail_unmatched = run_retail_inventory_cleaning()
-    print(f"   Retail matched columns: {list(retail_matched.columns)}")
-    print(f"   Retail matched shape: {retail_matched.shape}")
-    if 'TOTAL_QUANTITY' in retail_matched.columns:
-        print(f"   Retail TOTAL_QUANTITY: sum={retail_matched['TOTAL_QUANTITY'].sum()}")
-
-    print("🔍 Running wholesale inventory cleaner...")
-    wholesale_df = run_wholesale_inventory_cleaning()
-    print(f"   Wholesale columns: {list(wholesale_df.columns)}")
-    print(f"   Wholesale shape: {wholesale_df.shape}")
-    
-    wholesale_df = harmonize_wholesale_columns(wholesale_df)
-    print(f"   After harmonization: {list(wholesale_df.columns)}")
-    if 'TOTAL_QUANTITY' in wholesale_df.columns:
-        print(f"   Wholesale TOTAL_QUANTITY: sum={wholesale_df['TOTAL_QUANTITY'].sum()}")
-    
-    wholesale_matched, wholesale_unmatched = split_matched_unmatched(wholesale_df)
+    # replace just the snapshot dates we're about to load, per source, in one transaction (snowflake_upsert.py)
+    scope = []
+    if "INVENTORYDATE" in df.columns and not df.empty:
+        dates = pd.to_datetime(df["INVENTORYDATE"]).dt.date
+        wholesale = df["LOCATIONNAME"].eq("Wholesale")
+        for source_filter, mask in [(SOURCE_FILTERS['retail_inventory'], ~wholesale),
+                                    (SOURCE_FILTERS['wholesale_inventory'], wholesale)]:
+            source_dates = sorted(set(dates[mask].dropna()))
+            if source_dates:
+                scope.append(date_scope("INVENTORYDATE", source_dates, source_filter))
+                log.debug("🔄 Replacing %s snapshot(s) %s (%s)", table_name, ", ".join(map(str, source_dates)), source_filter)
+
+    upsert_partitions(get_connection('target'), df, table_name, UPSERT_KEYS, scope)
 
-    # Align schemas & combine
-    print("🔍 Aligning columns...")
-    retail_matched, wholesale_matched = align_columns(retail_matched, wholesale_matched)
-    retail_unmatched, wholesale_unmatched = align_columns(retail_unmatched, wholesale_unmatched)
+# ---------- Merge (stage of run_pipeline.py, after retail_inventory + wholesale_inventory) ----------
+def merge_inventory(retail, wholesale):
+    """(matched, unmatched) across the inventory sources that extracted; a failed one is left out."""
+    matched_parts, unmatched_parts = [], []
+    if retail.error is None:
+        retail_matched, retail_unmatched = retail.value
+        log.debug("Retail matched: shape %s, columns %s", retail_matched.shape, list(retail_matched.columns))
+        matched_parts.append(retail_matched)
+        unmatched_parts.append(retail_unmatched)
 
-    merged_matched = pd.concat([retail_matched, wholesale_matched], ignore_index=True)
-    merged_unmatched = pd.concat([retail_unmatched, wholesale_unmatched], ignore_index=True)
+    if wholesale.error is None:
+        wholesale_df = harmonize_wholesale_columns(wholesale.value)
+        log.debug("Wholesale (harmonized): shape %s, columns %s", wholesale_df.shape, list(wholesale_df.columns))
+        wholesale_matched, wholesale_unmatched = split_matched_unmatched(wholesale_df)
+        matched_parts.append(wholesale_matched)
+        unmatched_parts.append(wholesale_unmatched)
 
-    print(f"🔍 Final merged columns: {list(merged_matched.columns)}")
-    if 'TOTAL_QUANTITY' in merged_matched.columns:
-        print(f"   Final TOTAL_QUANTITY: sum={merged_matched['TOTAL_QUANTITY'].sum()}")
+    # Align schemas & combine (a lone source is aligned too, so the tables keep their schema)
+    return (pd.concat(align_columns(*matched_parts), ignore_index=True),
+            pd.concat(align_columns(*unmatched_parts), ignore_index=True))
+
+# ---------- Upload ----------
+def upload_inventory(merge):
+    started = time.perf_counter()
+    merged_matched, merged_unmatched = merge.value
 
     # Upload both matched and unmatched
     upload_to_snowflake(merged_matched,   "matched_inventory_with_snop_category")
     upload_to_snowflake(merged_unmatched, "unmatched_inventory_without_snop_category")
+    stage_summary(log, "Inventory upload", started, matched=len(merged_matched), unmatched=len(merged_unmatched))
+
+# ---------- Main ----------
+if __name__ == "__main__":
+    from run_pipeline import main
+    raise SystemExit(main(["--only", "inventory"]))
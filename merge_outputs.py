@@ -1,70 +1,103 @@
-
 import pandas as pd
 import os
-import snowflake.connector
+from collections import namedtuple
 from retail_cleaning import run_retail_cleaning
 from wholesale_cleaning import run_wholesale_cleaning
-from snowflake.connector.pandas_tools import write_pandas
+from snowflake_upsert import upsert_partitions, range_scope
+from pipeline_log import get_logger
+from snowflake_sessions import get_connection
+from watermarks import extract_window, save_watermark, loaded_through
+from summary_tables import touched_categories, refresh_summaries
+
+log = get_logger("merge_outputs")
+
+# --- Snowflake target: shared MY_SF_* session (GitHub Secrets), NEA_FORECASTING.PUBLIC ---
+# Stages of run_pipeline.py (extract_sales -> merge_sales -> upload_sales); `python merge_outputs.py`
+# runs just the sales branch of that graph.
+
+# rows each source owns in the target tables
+source_filters = {
+    'retail_sales': "COALESCE(LOCATIONNAME, '') <> 'Wholesale'",
+    'wholesale_sales': "LOCATIONNAME = 'Wholesale'",
+}
+cleaners = {
+    'retail_sales': run_retail_cleaning,
+    'wholesale_sales': run_wholesale_cleaning,
+}
 
-# --- Environment Variables (GitHub Secrets) ---
-SF_USER = os.getenv("MY_SF_USER")
-SF_PASS = os.getenv("MY_SF_PASS")
-SF_ACCOUNT = os.getenv("MY_SF_ACCT")
-SF_WAREHOUSE = "COMPUTE_WH"
-SF_DATABASE = "NEA_FORECASTING"
-SF_SCHEMA = "PUBLIC"
+UPSERT_KEYS = ['LOCATIONNAME', 'TRANSACTIONDATE', 'PRODUCTNAME']
 
-# --- Output Folder ---
-output_folder = r"C:\Users\Mitch\OneDrive\Desktop\Consulting\Vitalis Files\NEA\Merged_Output"
-os.makedirs(output_folder, exist_ok=True)
+SalesExtract = namedtuple("SalesExtract", ["source", "window", "matched", "unmatched"])
+SalesMerge = namedtuple("SalesMerge", ["matched", "unmatched", "windows", "loaded_through"])
 
-# --- Run Retail and Wholesale Scripts ---
-print("🚀 Running retail and wholesale scripts...")
-retail_matched, retail_unmatched, _, _ = run_retail_cleaning()
-wholesale_matched, wholesale_unmatched, _, _ = run_wholesale_cleaning()
+# --- Extract + Clean one source (per-source watermark + restatement window, see watermarks.py) ---
+def extract_sales(source):
+    window = extract_window(source)
+    # the cleaners' own summaries cover only their extract window; the summary tables are rebuilt on upload
+    matched, unmatched, _, _ = cleaners[source](*window)
+    return SalesExtract(source, window, matched, unmatched)
 
 # --- Align Columns ---
-def align_columns(df1, df2):
-    common_cols = list(set(df1.columns).intersection(df2.columns))
-    return df1[common_cols], df2[common_cols]
+# the columns retail and wholesale outputs share; a source loaded on its own is cut to them as well,
+# so a partial run uploads the same shape as a full one
+OUTPUT_COLUMNS = ['LOCATIONNAME', 'TRANSACTIONDATE', 'PRODUCTNAME', 'BRANDNAME', 'TOTAL_QUANTITY', 'TOTAL_REVENUE',
+                  'Matched S&OP Category', 'Matched Reference', 'Match Score', 'Match Result']
 
-retail_matched, wholesale_matched = align_columns(retail_matched, wholesale_matched)
-retail_unmatched, wholesale_unmatched = align_columns(retail_unmatched, wholesale_unmatched)
+def align_columns(*frames):
+    common_cols = [c for c in OUTPUT_COLUMNS if all(c in df.columns for df in frames)]
+    return [df[common_cols] for df in frames]
 
-# --- Combine Data ---
-merged_matched = pd.concat([retail_matched, wholesale_matched], ignore_index=True)
-merged_unmatched = pd.concat([retail_unmatched, wholesale_unmatched], ignore_index=True)
+# --- Combine Data (sources that failed to extract are left out; their rows stay as they are) ---
+def merge_sales(*extracts):
+    loaded = [r.value for r in extracts if r.error is None]
+    merged_matched = pd.concat(align_columns(*(e.matched for e in loaded)), ignore_index=True)
+    merged_unmatched = pd.concat(align_columns(*(e.unmatched for e in loaded)), ignore_index=True)
 
-# --- Ensure numeric type for TOTAL_QUANTITY ---
-for df in [merged_matched, merged_unmatched]:
-    if 'TOTAL_QUANTITY' in df.columns:
-        df['TOTAL_QUANTITY'] = pd.to_numeric(df['TOTAL_QUANTITY'], errors='coerce').astype(float)
+    # --- Ensure numeric type for TOTAL_QUANTITY ---
+    for df in [merged_matched, merged_unmatched]:
+        if 'TOTAL_QUANTITY' in df.columns:
+            df['TOTAL_QUANTITY'] = pd.to_numeric(df['TOTAL_QUANTITY'], errors='coerce').astype(float)
+
+    return SalesMerge(merged_matched, merged_unmatched,
+                      windows={e.source: e.window for e in loaded},
+                      loaded_through={e.source: loaded_through(e.matched, e.unmatched) for e in loaded})
 
 # --- Snowflake Import Function ---
-def upload_to_snowflake(df, table_name):
+def upload_to_snowflake(df, table_name, scope):
     df = df.copy()
     if 'TOTAL_QUANTITY' in df.columns:
         df['TOTAL_QUANTITY'] = pd.to_numeric(df['TOTAL_QUANTITY'], errors='coerce').astype(float)
-        print("⚠️ Rows with NaN TOTAL_QUANTITY:", df['TOTAL_QUANTITY'].isna().sum())
-
-    conn = snowflake.connector.connect(
-        user=SF_USER,
-        password=SF_PASS,
-        account=SF_ACCOUNT,
-        warehouse=SF_WAREHOUSE,
-        database=SF_DATABASE,
-        schema=SF_SCHEMA
-    )
-    if "TRANSACTIONDATE" in df.columns:
-        conn.cursor().execute(
-            f"DELETE FROM {table_name} WHERE TRANSACTIONDATE >= DATEADD(DAY, -90, CURRENT_DATE());"
-        )
-        print(f"🔄 Cleared {table_name} (last 30 days).")
-        print(f"🔄 Cleared {table_name} (last 30 days).")
-    success, nchunks, nrows, _ = write_pandas(conn, df, table_name.upper())
-    print(f"✅ Uploaded to {table_name}: {nrows} rows")
-    conn.close()
+        nan_rows = df['TOTAL_QUANTITY'].isna().sum()
+        if nan_rows:
+            log.warning("⚠️ Rows with NaN TOTAL_QUANTITY in %s: %d", table_name, nan_rows)
+
+    # staged + replaced in one transaction, keyed on location/date/product (snowflake_upsert.py)
+    scope = scope if "TRANSACTIONDATE" in df.columns else []
+    upsert_partitions(get_connection('target'), df, table_name, UPSERT_KEYS, scope)
 
 # --- Upload to Snowflake ---
-upload_to_snowflake(merged_matched, "matched_sales_with_snop_category")
-upload_to_snowflake(merged_unmatched, "unmatched_sales_without_snop_category")
+def upload_sales(merge):
+    merge = merge.value
+    # each loaded source only replaces the dates it re-extracted
+    sales_scope = [range_scope("TRANSACTIONDATE", start_date, end_date, source_filters[name])
+                   for name, (start_date, end_date) in merge.windows.items()]
+
+    # categories whose all-time totals change: read before the detail rows in scope are replaced
+    summary_categories = touched_categories(get_connection('target'), sales_scope, merge.matched)
+    upload_to_snowflake(merge.matched, "matched_sales_with_snop_category", sales_scope)
+    upload_to_snowflake(merge.unmatched, "unmatched_sales_without_snop_category", sales_scope)
+
+    # --- Summary Tables: touched dates / categories rebuilt from the detail (summary_tables.py) ---
+    refresh_summaries(get_connection('target'), sales_scope, summary_categories)
+
+    # --- Advance Watermarks (only once both tables are loaded) ---
+    for name, through in merge.loaded_through.items():
+        save_watermark(name, through)
+
+if __name__ == "__main__":
+    # --- Output Folder ---
+    output_folder = r"C:\Users\Mitch\OneDrive\Desktop\Consulting\Vitalis Files\NEA\Merged_Output"
+    os.makedirs(output_folder, exist_ok=True)
+
+    from run_pipeline import main
+    raise SystemExit(main(["--only", "sales"]))
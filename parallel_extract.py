@@ -0,0 +1,117 @@
+import os
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from pipeline_log import get_logger
+from extract_queries import QUERY_TIMEOUT
+
+# ——— PARAMETERS ———
+EXTRACT_WORKERS = int(os.getenv("EXTRACT_WORKERS", "4"))  # sources extracted at once (1 = one after another)
+STAGE_TIMEOUT   = int(os.getenv("STAGE_TIMEOUT", str(2 * QUERY_TIMEOUT)))  # whole stage (queries + cleaning), seconds
+
+log = get_logger("extract")
+
+StageResult = namedtuple("StageResult", ["value", "error", "seconds"])
+
+# ---------------------- Concurrent Stages ----------------------
+# Each source stage (extract + clean) spends most of its time waiting on the warehouse, so
+# stages run in threads sharing the process's Snowflake sessions (one cursor per query).
+# A thread cannot be stopped, so a stage that times out is abandoned, not cancelled: its thread
+# is a daemon (the process exits without waiting for it) and whatever it is doing, e.g. an
+# upload's COMMIT, may still complete after the run has reported it failed.
+
+def _timed(fn, *args):
+    started = time.perf_counter()
+    value = fn(*args)
+    return value, time.perf_counter() - started
+
+def _start(name, fn, inputs) -> Future:
+    future = Future()
+
+    def run():
+        future.set_running_or_notify_cancel()
+        try:
+            future.set_result(_timed(fn, *inputs))
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=run, name=f"stage-{name}", daemon=True).start()
+    return future
+
+# ---------------------- Stage Graph ----------------------
+# The full pipeline (run_pipeline.py) as a dependency graph: every stage starts as soon as its
+# inputs are ready, so retail / wholesale and sales / inventory branches overlap.
+
+Stage = namedtuple("Stage", ["fn", "deps"])
+
+def select_stages(graph: dict, targets) -> dict:
+    """`graph` restricted to `targets` and everything they depend on (declaration order kept)."""
+    keep, todo = set(), list(targets)
+    while todo:
+        name = todo.pop()
+        if name not in graph:
+            raise ValueError(f"Unknown stage {name!r}; stages: {', '.join(graph)}")
+        if name not in keep:
+            keep.add(name)
+            todo.extend(graph[name].deps)
+    return {name: stage for name, stage in graph.items() if name in keep}
+
+def run_graph(graph: dict, workers: int = EXTRACT_WORKERS, timeout: int = STAGE_TIMEOUT,
+              done: dict = None, on_done=None) -> dict:
+    """
+    name -> StageResult for `graph` (name -> Stage(fn, deps)). A stage is called with the
+    StageResult of each dep, in order, once all of them have finished, and runs if at least one
+    succeeded (a merge can load the sources that did extract); otherwise it is skipped and fails
+    too. At most `workers` stages run at once. A stage that raises, or runs longer than `timeout`
+    seconds from its own start, is logged and reported through .error; a timed-out stage may
+    still be running, so the stages that depend on it are skipped rather than run beside it.
+    `done` pre-fills results of stages that are not run again (resume); on_done(name, result)
+    is called for every stage that succeeds.
+    """
+    results, running = dict(done or {}), {}  # running: future -> (name, started)
+    pending = {name: stage for name, stage in graph.items() if name not in results}
+    timed_out = set()
+    while pending or running:
+        ready = [name for name, stage in pending.items() if all(d in results for d in stage.deps)]
+        for name in ready:
+            stage = pending[name]
+            inputs = [results[d] for d in stage.deps]
+            abandoned = [d for d in stage.deps if d in timed_out]
+            if abandoned or (inputs and all(r.error is not None for r in inputs)):
+                del pending[name]
+                if abandoned:
+                    log.error("⏭️ %s skipped: %s timed out and may still be running", name, ", ".join(abandoned))
+                else:
+                    log.error("⏭️ %s skipped: %s failed", name, ", ".join(stage.deps))
+                results[name] = StageResult(None, RuntimeError(f"{name} skipped, upstream failed"), 0.0)
+            elif len(running) < max(1, workers):
+                del pending[name]
+                running[_start(name, stage.fn, inputs)] = (name, time.perf_counter())
+        if not running:
+            if pending and not ready:
+                raise ValueError(f"Stages with unmet dependencies: {', '.join(pending)}")
+            continue
+
+        wait_for = max(0.0, min(t0 + timeout for _, t0 in running.values()) - time.perf_counter())
+        finished, _ = wait(running, timeout=wait_for, return_when=FIRST_COMPLETED)
+        for future in finished:
+            name, t0 = running.pop(future)
+            try:
+                value, seconds = future.result()
+                results[name] = StageResult(value, None, seconds)
+                if on_done is not None:
+                    on_done(name, results[name])
+            except Exception as e:
+                log.error("❌ %s failed: %s", name, e, exc_info=True)
+                results[name] = StageResult(None, e, time.perf_counter() - t0)
+        for future, (name, t0) in list(running.items()):
+            if time.perf_counter() - t0 >= timeout:
+                del running[future]
+                timed_out.add(name)
+                log.error("❌ %s did not finish within %ds; continuing without it (it may still complete in the background)",
+                          name, timeout)
+                results[name] = StageResult(None, TimeoutError(f"{name} exceeded {timeout}s"), timeout)
+    log.debug("Stages: %s", ", ".join(
+        f"{n}={'failed' if r.error else f'{r.seconds:.1f}s'}" for n, r in results.items()))
+    return {name: results[name] for name in graph}
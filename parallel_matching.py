@@ -0,0 +1,54 @@
+import multiprocessing as mp
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from pipeline_log import get_logger
+
+# ——— PARAMETERS ———
+MATCH_WORKERS  = int(os.getenv("MATCH_WORKERS", "1"))  # >1 shards unique products across forked processes (opt-in)
+MIN_SHARD_ROWS = 250  # smaller shards cost more in process start-up than they save
+
+log = get_logger("matching")
+
+# (match function, frame) of the pool a worker belongs to, set in the worker by _init_worker.
+# Handed over as initargs, which a fork-started worker inherits instead of unpickling, so the
+# catalog indexes the match function closes over are never pickled; the parent never sets it.
+_SHARED = None
+
+# One sharded match at a time per process: concurrent stages (sales + inventory) each fork a full
+# pool, so they queue here rather than oversubscribing the cores and forking while another pool
+# starts. logging re-creates its locks in a forked child; workers use no Snowflake / SQLite handle.
+_FORK_LOCK = threading.Lock()
+
+# ---------------------- Sharded Matching ----------------------
+
+def _init_worker(match_fn, frame):
+    global _SHARED
+    _SHARED = (match_fn, frame)
+
+def _match_shard(bounds):
+    match_fn, frame = _SHARED
+    start, stop = bounds
+    # one process per core already, so each shard scores single-threaded
+    return match_fn(frame.iloc[start:stop], 1)
+
+def parallel_match(match_fn, frame: pd.DataFrame, workers: int = MATCH_WORKERS) -> pd.DataFrame:
+    """
+    match_fn(frame_slice, threads) -> per-row result DataFrame indexed like the slice.
+    With workers > 1 the frame is cut into contiguous shards matched in a fork-based
+    ProcessPoolExecutor and the results are concatenated in shard order, so the output
+    is identical to match_fn(frame, -1). Runs in-process when workers <= 1, the frame
+    is too small to shard, or the platform cannot fork (Windows).
+    """
+    shards = min(workers, len(frame) // MIN_SHARD_ROWS) if workers > 1 else 0
+    if shards < 2 or 'fork' not in mp.get_all_start_methods():
+        return match_fn(frame, -1)
+
+    bounds = np.linspace(0, len(frame), shards + 1).astype(int)
+    with _FORK_LOCK, ProcessPoolExecutor(max_workers=shards, mp_context=mp.get_context('fork'),
+                                         initializer=_init_worker, initargs=(match_fn, frame)) as pool:
+        parts = list(pool.map(_match_shard, zip(bounds[:-1], bounds[1:])))
+    log.debug("Matched %d products in %d parallel shards", len(frame), shards)
+    return pd.concat(parts)
@@ -0,0 +1,47 @@
+import logging
+import os
+import sys
+import time
+
+# ——— PARAMETERS ———
+# INFO (default) gives one summary line per stage; DEBUG adds checkpoints, column sums and traces.
+LOG_LEVEL  = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = "%(asctime)s %(levelname)-7s %(name)s | %(message)s"
+
+_root = logging.getLogger("nea")
+if not _root.handlers:
+    _handler = logging.StreamHandler(sys.stdout)  # stdout, like the prints it replaces, so Actions logs keep their order
+    _handler.setFormatter(logging.Formatter(LOG_FORMAT, datefmt="%H:%M:%S"))
+    _root.addHandler(_handler)
+    _root.setLevel(LOG_LEVEL)
+    _root.propagate = False
+
+# ---------------------- Loggers ----------------------
+
+def get_logger(name: str) -> logging.Logger:
+    """Pipeline logger ("nea.<name>"); level from LOG_LEVEL."""
+    return logging.getLogger(f"nea.{name}")
+
+def debug_enabled(log: logging.Logger) -> bool:
+    """Guard for debug-only work (checkpoint loops, full-column sums) that should not run otherwise."""
+    return log.isEnabledFor(logging.DEBUG)
+
+class lazy:
+    """
+    Deferred log argument: log.debug("sum=%s", lazy(lambda: df['X'].sum())) only computes
+    the sum when the record is actually emitted.
+    """
+    __slots__ = ("fn",)
+
+    def __init__(self, fn):
+        self.fn = fn
+
+    def __str__(self):
+        return str(self.fn())
+
+# ---------------------- Stage Summaries ----------------------
+
+def stage_summary(log: logging.Logger, stage: str, started: float, **counts):
+    """One INFO line per pipeline stage: "✅ <stage>: k=v, ... (1.2s)"; started is a time.perf_counter() value."""
+    fields = ", ".join(f"{k}={v}" for k, v in counts.items())
+    log.info("✅ %s: %s (%.1fs)", stage, fields, time.perf_counter() - started)
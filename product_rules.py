@@ -0,0 +1,154 @@
+from collections import namedtuple
+import numpy as np
+import pandas as pd
+from pipeline_log import get_logger
+
+log = get_logger("rules")
+
+# ---------------------- Category Overrides ----------------------
+# Name-keyword overrides for products the matcher (or the SKU) left without a category.
+# Rules are checked in order; the first one whose keyword is in the product name (and, for
+# nea_fire rules, "nea fire" in the brand or name) sets all four result columns.
+
+OverrideRule = namedtuple('OverrideRule', ['keyword', 'nea_fire', 'category', 'score', 'reference', 'result'])
+
+OverrideProfile = namedtuple('OverrideProfile', [
+    'result_columns',  # (category, score, reference, result) column names in this pipeline
+    'unmatched',       # category Series -> mask of rows the rules may override
+    'fire_in_name',    # "nea fire" in the product name counts as well as in the brand
+    'rules',
+])
+
+RETAIL_BULK_RULES = [
+    OverrideRule('bulk', True,  'NEA Fire Bulk Flower g', 100, 'bulk name brand rule', 'Bulk Override'),
+    OverrideRule('bulk', False, 'NEA Bulk Flower g',       95, 'bulk name rule',       'Bulk Override'),
+]
+
+RETAIL_RESULT_COLUMNS    = ('Matched S&OP Category', 'Match Score', 'Matched Reference', 'Match Result')
+WHOLESALE_RESULT_COLUMNS = ('MATCHED_SNOP_CATEGORY', 'MATCH_SCORE', 'MATCHED_REFERENCE', 'MATCH_RESULT')
+
+OVERRIDE_PROFILES = {
+    'retail_sales': OverrideProfile(
+        RETAIL_RESULT_COLUMNS, lambda cat: cat.isna() | (cat == ""), True, RETAIL_BULK_RULES,
+    ),
+    'retail_inventory': OverrideProfile(
+        RETAIL_RESULT_COLUMNS, lambda cat: cat.isna(), False, RETAIL_BULK_RULES,
+    ),
+    'wholesale_inventory': OverrideProfile(
+        WHOLESALE_RESULT_COLUMNS, lambda cat: cat.isna() | (cat.astype(str).str.strip() == ""), True, [
+            OverrideRule('trim', True,  'NEA Fire Bulk Flower g', 95, 'trim name brand rule', 'Trim Override'),
+            OverrideRule('trim', False, 'NEA Bulk Flower g',      90, 'trim name rule',       'Trim Override'),
+            OverrideRule('bulk', True,  'NEA Fire Bulk Flower g', 95, 'bulk name brand rule', 'Bulk Override'),
+            OverrideRule('bulk', False, 'NEA Bulk Flower g',      90, 'bulk name rule',       'Bulk Override'),
+        ],
+    ),
+}
+
+def apply_overrides(results: pd.DataFrame, names: pd.Series, brands: pd.Series, profile_name: str) -> pd.Series:
+    """
+    Applies the profile's override rules to `results` in place (names/brands aligned to its
+    index) and returns each overridden row's Match Result (empty when nothing fired).
+    """
+    profile = OVERRIDE_PROFILES[profile_name]
+    cat_col = profile.result_columns[0]
+    names = names.astype(str).str.lower()
+    fire = brands.astype(str).str.lower().str.contains('nea fire', regex=False)
+    if profile.fire_in_name:
+        fire = fire | names.str.contains('nea fire', regex=False)
+
+    open_rows = profile.unmatched(results[cat_col]).to_numpy(dtype=bool)
+    conditions = [
+        open_rows & names.str.contains(rule.keyword, regex=False).to_numpy(dtype=bool)
+        & (fire.to_numpy(dtype=bool) if rule.nea_fire else True)
+        for rule in profile.rules
+    ]
+    picked = np.select(conditions, np.arange(len(profile.rules)), default=-1)
+    hit = picked >= 0
+    if hit.any():
+        rows = [profile.rules[k][2:] for k in picked[hit]]
+        for j, col in enumerate(profile.result_columns):
+            # plain python values, so each column keeps its dtype (object / float scores)
+            results.loc[hit, col] = [row[j] for row in rows]
+    return results.loc[hit, profile.result_columns[3]]
+
+# ---------------------- Unit Conversion ----------------------
+# Wholesale quantities to sellable units: bulk/trim is sold by the pound and tracked in grams,
+# cased products are multiplied out. Rules are checked in order; the first whose weight
+# unit (None = any) and bulk/trim condition (None = any) match sets the multiplier.
+
+POUNDS_TO_GRAMS = 453.6
+
+UnitRule = namedtuple('UnitRule', ['weight_units', 'bulk_trim', 'multiplier'])  # multiplier: number or 'UNITSPERCASE'
+
+UnitProfile = namedtuple('UnitProfile', [
+    'quantity_column',
+    'falsy_defaults',  # quantity / units-per-case default when falsy (0 included), else only when None
+    'rules',
+])
+
+UNIT_PROFILES = {
+    'wholesale_sales': UnitProfile('QUANTITY', False, [
+        UnitRule(('Grams',), True, POUNDS_TO_GRAMS),
+        UnitRule(('Grams',), None, 1),
+        UnitRule(('Units', 'Unit'), None, 1),
+        UnitRule(None, None, 'UNITSPERCASE'),
+    ]),
+    'wholesale_inventory': UnitProfile('QUANTITYONHAND', True, [
+        UnitRule(None, True, POUNDS_TO_GRAMS),
+        UnitRule(None, None, 'UNITSPERCASE'),
+    ]),
+}
+
+def _numeric(column: pd.Series, default: float, falsy_default: bool):
+    """(float values, unparseable mask); NULLs (and 0 with falsy_default) become `default`."""
+    raw = column.to_numpy(dtype=object)
+    values = pd.to_numeric(column, errors='coerce').to_numpy(dtype=float)
+    # Arrow extracts deliver NULL numbers as NaN, so any null counts as missing
+    missing = pd.isna(raw)
+    if falsy_default:
+        missing |= values == 0
+    values[missing] = default
+    return values, np.isnan(values) & pd.notna(raw)
+
+def _weight_units(column: pd.Series):
+    """(stripped units, unreadable mask); a missing unit reads as blank, a non-text one is unreadable."""
+    raw = column.to_numpy(dtype=object)
+    text = np.fromiter((isinstance(v, str) for v in raw), dtype=bool, count=len(raw))
+    unit = pd.Series([v.strip() if t else '' for v, t in zip(raw, text)], index=column.index, dtype=object)
+    return unit, ~text & pd.notna(raw)
+
+def convert_to_units(frame: pd.DataFrame, profile_name: str) -> pd.Series:
+    """
+    Unit count per row as one column operation. Rows whose quantity, units per case or
+    weight unit cannot be read convert to 0.0.
+    """
+    profile = UNIT_PROFILES[profile_name]
+    quantity, bad_quantity = _numeric(frame[profile.quantity_column], 0.0, profile.falsy_defaults)
+    per_case, bad_case = _numeric(frame['UNITSPERCASE'], 1.0, profile.falsy_defaults)
+    # only profiles with weight-unit rules read WEIGHTUNIT (inventory's is UNITSIZE, often numeric)
+    if any(rule.weight_units is not None for rule in profile.rules):
+        unit, bad_unit = _weight_units(frame['WEIGHTUNIT'])
+    else:
+        unit, bad_unit = pd.Series('', index=frame.index), np.zeros(len(frame), dtype=bool)
+    names = frame['PRODUCTNAME'].fillna('').astype(str).str.upper()
+    bulk_trim = (names.str.contains('BULK', regex=False) | names.str.contains('TRIM', regex=False)).to_numpy(dtype=bool)
+
+    conditions, multipliers = [], []
+    for rule in profile.rules:
+        cond = np.ones(len(frame), dtype=bool)
+        if rule.weight_units is not None:
+            cond &= unit.isin(rule.weight_units).to_numpy(dtype=bool)
+        if rule.bulk_trim is not None:
+            cond &= bulk_trim == rule.bulk_trim
+        conditions.append(cond)
+        multipliers.append(per_case if rule.multiplier == 'UNITSPERCASE' else np.full(len(frame), float(rule.multiplier)))
+    units = quantity * np.select(conditions, multipliers, default=np.nan)
+    bad = bad_quantity | bad_case | bad_unit
+    units[bad] = 0.0
+
+    pounds = np.select(conditions, [rule.multiplier == POUNDS_TO_GRAMS for rule in profile.rules], False) & ~bad
+    if pounds.any():
+        log.debug("🔧 Converted %d bulk/trim rows from pounds to grams", pounds.sum())
+    if bad.any():
+        log.warning("⚠️ %d rows had an unreadable quantity, units per case or weight unit (set to 0)", bad.sum())
+    return pd.Series(units, index=frame.index)
@@ -0,0 +1,131 @@
+import re
+from collections import namedtuple
+
+# ---------------------- Reference Feature Table ----------------------
+
+# Everything the lock rules need to know about one catalog entry, computed once per run.
+RefFeatures = namedtuple('RefFeatures', [
+    'name',             # normalized reference name (the fuzzy-match choice)
+    'category',         # S&OP category exactly as stored in the catalog
+    'has_category',     # truthiness of the category, as the brand lock tests it
+    'grams',            # grams parsed from the reference name
+    'flavors',          # flavor tokens of the reference name
+    'flavor_set',       # same tokens as a frozenset for intersection checks
+    'flavor_str',       # flavor string of the reference name
+    'strain',           # hybrid / indica / sativa parsed from the category
+    'pack',             # "(Npk)" pack size parsed from the reference name, as a string
+    'cat_preroll', 'cat_infused', 'cat_concentrate', 'cat_flower', 'cat_vape',
+    'cat_nea', 'cat_nea_fire', 'cat_nea_premium', 'cat_nea_awarded', 'cat_valorem',
+])
+
+PACK_PATTERN = re.compile(r'\((\d+)pk\)')
+
+def reference_features(name, category, grams, flavor_tokens, flavor_string, strain_of):
+    mc = str(category).lower()
+    flavors = flavor_tokens(name)
+    pack = PACK_PATTERN.search(str(name).lower())
+    return RefFeatures(
+        name=name,
+        category=category,
+        has_category=bool(category),
+        grams=grams,
+        flavors=flavors,
+        flavor_set=frozenset(flavors),
+        flavor_str=flavor_string(name),
+        strain=strain_of(category),
+        pack=pack.group(1) if pack else None,
+        cat_preroll='preroll' in mc,
+        cat_infused='infused' in mc,
+        cat_concentrate='concentrate' in mc,
+        cat_flower='flower' in mc,
+        cat_vape='vape' in mc,
+        cat_nea='nea' in mc,
+        cat_nea_fire='nea fire' in mc,
+        cat_nea_premium='nea premium' in mc,
+        cat_nea_awarded='nea awarded' in mc,
+        cat_valorem='valorem' in mc,
+    )
+
+def build_reference_features(reference_names, name_to_category, name_to_grams,
+                             flavor_tokens, flavor_string, strain_of):
+    """
+    {reference name: RefFeatures} for every fuzzy-match choice.
+    The text helpers are passed in because the sales and inventory cleaners
+    each keep their own flavor/strain parsing.
+    """
+    return {
+        name: reference_features(
+            name, name_to_category.get(name), name_to_grams.get(name),
+            flavor_tokens, flavor_string, strain_of
+        )
+        for name in reference_names
+    }
+
+# ---------------------- Candidate Blocking ----------------------
+
+# Brands the brand/category lock restricts; every other brand can match any category.
+BRAND_FAMILIES = ('nea fire', 'nea premium', 'nea awarded', 'valorem')
+
+def brand_family(brand):
+    pb = str(brand).strip().lower() if brand else ''
+    return pb if pb in BRAND_FAMILIES else ''
+
+def token_sort_key(text):
+    """Two names score token_sort_ratio 100 exactly when their sorted tokens are equal."""
+    return " ".join(sorted(str(text).split()))
+
+def build_token_exact_index(reference_names):
+    """{sorted-token key: (first reference name with that key, its position)}."""
+    index = {}
+    for pos, name in enumerate(reference_names):
+        index.setdefault(token_sort_key(name), (name, pos))
+    return index
+
+# ---------------------- Preroll Fallback Index ----------------------
+
+def _grams_bucket(grams):
+    # |a - b| < 0.05  =>  round(10a) and round(10b) differ by at most one bucket
+    return int(round(grams * 10))
+
+def build_preroll_index(catalog_df, strain_of, grams_of):
+    """
+    Index the catalog's preroll rows once per run, keyed on
+    (strain, pack size, brand, grams bucket). Each entry keeps its catalog
+    position so lookups return the same row a top-to-bottom scan would.
+    """
+    index = {}
+    brands = catalog_df['Brand'] if 'Brand' in catalog_df.columns else [''] * len(catalog_df)
+    for pos, (name, brand, category) in enumerate(
+            zip(catalog_df['PRODUCTNAME'], brands, catalog_df['SNOPCATEGORY'])):
+        rn = str(name).lower()
+        if 'preroll' not in rn:
+            continue
+        rg = grams_of(rn)
+        if not rg:
+            continue
+        rp = PACK_PATTERN.search(rn)
+        key = (strain_of(rn), int(rp.group(1)) if rp else None, str(brand).lower(), _grams_bucket(rg))
+        index.setdefault(key, []).append((pos, rg, category, name))
+    return index
+
+def preroll_lookup(index, product, brand, strain_of, grams_of):
+    """(SNOPCATEGORY, PRODUCTNAME) of the first catalog preroll matching strain, grams, pack and brand, else None."""
+    product = str(product).lower()
+    if 'preroll' not in product:
+        return None
+    grams = grams_of(product)
+    if not grams:
+        return None
+    pack = PACK_PATTERN.search(product)
+    strain, pack_size, brand = strain_of(product), int(pack.group(1)) if pack else None, str(brand).lower()
+    bucket = _grams_bucket(grams)
+    hits = [
+        entry
+        for b in (bucket - 1, bucket, bucket + 1)
+        for entry in index.get((strain, pack_size, brand, b), [])
+        if abs(grams - entry[1]) < 0.05
+    ]
+    if not hits:
+        return None
+    _, _, category, name = min(hits)
+    return category, name
@@ -0,0 +1,355 @@
+import threading
+from collections import namedtuple
+import numpy as np
+import pandas as pd
+from rapidfuzz import process, fuzz
+from dotenv import load_dotenv
+from batch_matching import batch_extract_blocked, unique_match_keys, broadcast_results
+from match_cache import MatchCache, catalog_fingerprint, match_cache_keys
+from catalog_snapshot import load_catalog_snapshot
+import parallel_matching
+from parallel_matching import parallel_match
+from reference_index import (build_reference_features, build_preroll_index, preroll_lookup,
+                             brand_family, token_sort_key, build_token_exact_index)
+from lock_rules import (reference_arrays, row_arrays, candidate_matrix, rule_masks,
+                        strict_rule_mask, best_valid_matches, block_mask)
+from product_rules import apply_overrides
+from pipeline_log import get_logger
+from text_features import NAME_FEATURES, clean_name, normalize_name, extract_grams, extract_strain
+
+load_dotenv()
+
+log = get_logger("matching")
+
+# ——— PARAMETERS ———
+STRICT_THRESHOLD  = 75    # token_sort_ratio cutoff for strict rules
+PARTIAL_THRESHOLD = 70    # partial_ratio cutoff for edibles backup
+CANDIDATE_LIMIT   = 5     # fuzzy candidates checked against the locks per product
+BATCH_MATCHING    = True  # score all distinct names in one blocked cdist pass instead of per row
+USE_MATCH_CACHE   = True  # reuse per-product results from earlier runs against the same catalog
+
+MATCH_KEYS     = ['PRODUCTNAME', 'BRANDNAME', 'ProductType', 'PRODUCTGRAMS', 'StrainType']
+RESULT_COLUMNS = ['Matched S&OP Category', 'Match Score', 'Matched Reference', 'Match Result']
+FAILED_CHECK_RULES = ['pr_lock', 'type_conflict', 'packaging', 'brand_lock', 'infused_lock',
+                      'strain_check', 'strain_strict_lock', 'grams_check']
+
+# ---------------------- Rule Profiles ----------------------
+# How the sales and inventory cleaners differ, beyond the lock rules (lock_rules.py)
+# and name parsing (text_features.py) registered under the same profile name.
+
+MatchProfile = namedtuple('MatchProfile', [
+    'name',               # profile key for lock_rules / text_features / the match cache
+    'label',              # what one row of the frame is, for the summary line
+    'normalized_names',   # reference + exact-match keys: normalized names (else lowercased / raw catalog names)
+    'confidence_override',  # a token-identical reference (score 100) wins before the locks run
+    'failed_checks',      # record the locks an unmatched row's best fuzzy reference fails
+    'fallback_if',        # (category, result) test that sends a preroll to the structured fallback
+    'fallback_resets',    # a fallback miss resets the row to "No Acceptable Match"
+])
+
+MATCH_PROFILES = {
+    'retail_sales': MatchProfile(
+        name='retail_sales', label='sales rows', normalized_names=False,
+        confidence_override=False, failed_checks=False,
+        fallback_if=lambda cat, result: not cat and 'Exact Match' not in result, fallback_resets=True,
+    ),
+    'retail_inventory': MatchProfile(
+        name='retail_inventory', label='inventory rows', normalized_names=True,
+        confidence_override=True, failed_checks=True,
+        fallback_if=lambda cat, result: pd.isna(cat), fallback_resets=False,
+    ),
+}
+
+# everything a profile matches against, built from the catalog once per process
+CatalogTables = namedtuple('CatalogTables', [
+    'reference_names', 'name_to_category', 'exact_map', 'ref_index', 'refs', 'token_exact',
+])
+
+# ---------------------- Helpers ----------------------
+
+def normalized_name(text):
+    return normalize_name(clean_name(text)) if pd.notna(text) else ''
+
+def best_match_exact_priority(candidates, product_name):
+    if not candidates:
+        return None
+    candidates.sort(key=lambda x: (x[1], fuzz.partial_ratio(x[0], product_name)), reverse=True)
+    return candidates[0]
+
+def _exception_name_keys(raw: str, brand: str) -> list[str]:
+    """
+    Generate extra match keys ONLY for exact-match lookup, to handle odd spellings
+    or mojibake of specific product names without changing global logic.
+    """
+    keys = set()
+
+    def _add(s: str):
+        if s is None:
+            return
+        # Reuse existing normalization so keys align with catalog dicts
+        keys.add(normalized_name(s))
+
+    # Base names (as-is)
+    _add(raw)
+    _add(f"{raw} - {brand}")
+
+    # Targeted mojibake repairs (name-only, not global). Add more pairs if ever needed.
+    replacements = [
+        ("Ã©", "é"), ("ã©", "é"),
+        ("Ã±", "ñ"), ("ã±", "ñ"),
+        ("Ã¼", "ü"), ("ã¼", "ü"),
+    ]
+    for bad, good in replacements:
+        if bad in str(raw):
+            fixed = str(raw).replace(bad, good)
+            _add(fixed)
+            _add(f"{fixed} - {brand}")
+
+    # Opportunistic decode attempts (latin-1/cp1252 → utf-8), scoped to the name only
+    for enc in ("latin-1", "cp1252"):
+        try:
+            fixed = str(raw).encode(enc, "strict").decode("utf-8", "strict")
+            if fixed != raw:
+                _add(fixed)
+                _add(f"{fixed} - {brand}")
+        except Exception:
+            pass
+
+    return [k for k in keys if k]  # deduped, normalized keys
+
+# ---------------------- Matcher ----------------------
+
+class RetailMatcher:
+    """
+    PRODUCT_CATALOG and its match indexes, shared by the sales and inventory cleaners.
+    Per-profile reference tables are built on first use and kept for the process;
+    match(frame, profile) fills the result columns for every row of a cleaned frame.
+    """
+
+    def __init__(self, catalog_df: pd.DataFrame, batch_matching: bool = None,
+                 use_match_cache: bool = None, workers: int = None, catalog_version: str = None):
+        # unset options follow the module parameters at construction time
+        catalog_df = catalog_df.copy()
+        catalog_df.columns = catalog_df.columns.str.strip()
+        if 'PRODUCTNAME' not in catalog_df.columns:
+            raise KeyError("❌ Column 'PRODUCTNAME' is missing from product_catalog_df. Please verify the PRODUCT_CATALOG table structure.")
+        self.catalog_df = catalog_df
+        # snapshot version when loaded from catalog_snapshot, else hashed here; keys the match cache
+        self.catalog_hash = catalog_version or catalog_fingerprint(catalog_df)
+        self.batch_matching = BATCH_MATCHING if batch_matching is None else batch_matching
+        self.use_match_cache = USE_MATCH_CACHE if use_match_cache is None else use_match_cache
+        self.workers = parallel_matching.MATCH_WORKERS if workers is None else workers
+        self.sop_list = catalog_df['SNOPCATEGORY'].dropna().str.lower().tolist()
+        self.preroll_index = build_preroll_index(catalog_df, extract_strain, extract_grams)
+        self._tables = {}
+
+    @classmethod
+    def from_snowflake(cls, **options):
+        catalog_df, version = load_catalog_snapshot()
+        return cls(catalog_df, catalog_version=version, **options)
+
+    def tables(self, profile_name: str) -> CatalogTables:
+        if profile_name not in self._tables:
+            self._tables[profile_name] = self._build_tables(MATCH_PROFILES[profile_name])
+        return self._tables[profile_name]
+
+    def _build_tables(self, profile):
+        catalog = self.catalog_df
+        if profile.normalized_names:
+            names = catalog['PRODUCTNAME'].apply(normalized_name)
+        else:
+            names = catalog['PRODUCTNAME'].str.lower()
+        keyed = pd.DataFrame({
+            'Normalized': names, 'GRAMS': names.apply(extract_grams), 'SNOPCATEGORY': catalog['SNOPCATEGORY'],
+        }).set_index('Normalized')
+        name_to_category = keyed['SNOPCATEGORY'].to_dict()
+        name_to_grams = keyed['GRAMS'].to_dict()
+        if profile.normalized_names:
+            reference_names = list(name_to_category.keys())
+            exact_map = name_to_category
+        else:
+            reference_names = names.dropna().unique().tolist()
+            # sales looks up raw catalog names, case-sensitive
+            exact_map = catalog.set_index('PRODUCTNAME')['SNOPCATEGORY'].dropna().to_dict()
+
+        name_features = NAME_FEATURES[profile.name]
+        ref_index = build_reference_features(
+            reference_names, name_to_category, name_to_grams,
+            lambda n: name_features(n)[3], lambda n: name_features(n)[4], extract_strain
+        )
+        return CatalogTables(
+            reference_names=reference_names,
+            name_to_category=name_to_category,
+            exact_map=exact_map,
+            ref_index=ref_index,
+            refs=reference_arrays(ref_index[n] for n in reference_names),
+            token_exact=build_token_exact_index(reference_names),
+        )
+
+    # ---------------------- Batch API ----------------------
+
+    def match(self, frame: pd.DataFrame, profile_name: str) -> pd.DataFrame:
+        """
+        Match every row of `frame` (cleaned by text_features under the same profile) and
+        write the result columns onto it. Each distinct product is matched once; products
+        already matched against this catalog come from the match cache.
+        """
+        profile = MATCH_PROFILES[profile_name]
+        res_cols = RESULT_COLUMNS + (['Failed Checks'] if profile.failed_checks else [])
+        uniq, key_codes = unique_match_keys(frame, MATCH_KEYS)
+
+        # match cache: only products not seen against this catalog are matched below
+        cache_keys = match_cache_keys(uniq, MATCH_KEYS)
+        cache = MatchCache(profile.name, self.catalog_hash) if self.use_match_cache else None
+        cached = cache.get_many(cache_keys) if cache else {}
+        todo = uniq.loc[[k not in cached for k in cache_keys]]
+        self.tables(profile.name)  # build before any fork so shards inherit the indexes
+
+        # one call, or one per shard when workers > 1
+        res = parallel_match(
+            lambda part, threads: self._match_products(part, profile, res_cols, threads),
+            todo, self.workers
+        )
+
+        # merge fresh and cached results, persist the fresh ones
+        fresh = dict(zip(res.index, res.itertuples(index=False, name=None)))
+        if cache:
+            cache.put_many({cache_keys[i]: r for i, r in fresh.items()})
+        res = pd.DataFrame(
+            [fresh[i] if i in fresh else cached[k] for i, k in enumerate(cache_keys)],
+            columns=res_cols, dtype=object
+        )
+
+        # broadcast per-key results back to every row
+        broadcast_results(frame, res, key_codes)
+        log.info("✅ Matched %d new of %d unique products for %d %s%s", len(todo), len(uniq), len(frame),
+                 profile.label, f" | {cache.summary()}" if cache else "")
+        if cache:
+            cache.close()
+        return frame
+
+    def _match_products(self, todo, profile, res_cols, threads):
+        tables = self.tables(profile.name)
+        res = pd.DataFrame(None, index=todo.index, columns=res_cols, dtype=object)
+
+        # fuzzy candidates: one matrix pass per block of lock-compatible references,
+        # or one process.extract call per row
+        if self.batch_matching:
+            block_keys = list(zip(
+                todo['ProductType'], todo['BRANDNAME'].map(brand_family),
+                todo['PRODUCTGRAMS'], todo['StrainType']
+            ))
+            fuzzy_candidates = batch_extract_blocked(
+                todo['Cleaned PRODUCTNAME'], block_keys, tables.reference_names,
+                lambda key: block_mask(profile.name, key, tables.refs),
+                scorer=fuzz.token_sort_ratio, limit=CANDIDATE_LIMIT,
+                score_cutoff=STRICT_THRESHOLD, workers=threads
+            )
+            if profile.confidence_override:
+                # the override ignores locks, so a token-identical reference
+                # outside the row's block still comes first
+                for cands, cleaned in zip(fuzzy_candidates, todo['Cleaned PRODUCTNAME']):
+                    exact = tables.token_exact.get(token_sort_key(cleaned))
+                    if exact:
+                        cands.insert(0, (exact[0], 100.0, exact[1]))
+        else:
+            fuzzy_candidates = [
+                process.extract(cleaned, tables.reference_names, scorer=fuzz.token_sort_ratio, limit=CANDIDATE_LIMIT)
+                for cleaned in todo['Cleaned PRODUCTNAME']
+            ]
+
+        # strict rules: every lock evaluated at once over the (row × candidate) matrix
+        cand, scores = candidate_matrix(fuzzy_candidates)
+        valid = strict_rule_mask(profile.name, row_arrays(todo), tables.refs, cand, scores, STRICT_THRESHOLD)
+        strict_matches = best_valid_matches(
+            cand, scores, valid, tables.reference_names,
+            todo['Cleaned PRODUCTNAME'].tolist(), best_match_exact_priority
+        )
+
+        for (i, row), cands, strict_match in zip(todo.iterrows(), fuzzy_candidates, strict_matches):
+            cat, score, ref, result = self._match_row(row, profile, tables, cands, strict_match)
+
+            # fallback: structured pre-roll match
+            if profile.fallback_if(cat, result) and row['ProductType'] == 'flower' and 'preroll' in row['Cleaned PRODUCTNAME']:
+                hit = preroll_lookup(self.preroll_index, row['PRODUCTNAME'], row['BRANDNAME'], extract_strain, extract_grams)
+                if hit:
+                    cat, score, ref, result = hit[0], 90, hit[1], "Fallback Preroll Match"
+                elif profile.fallback_resets:
+                    cat, score, ref, result = None, None, None, "No Acceptable Match"
+
+            res.at[i, 'Matched S&OP Category'] = cat
+            res.at[i, 'Match Score']           = score
+            res.at[i, 'Matched Reference']     = ref
+            res.at[i, 'Match Result']          = result
+
+        # bulk override for whatever is still without a category (product_rules.py)
+        apply_overrides(res, todo['PRODUCTNAME'], todo['BRANDNAME'], profile.name)
+
+        # log failed locks for truly unmatched, checked against each row's single best fuzzy reference
+        if profile.failed_checks:
+            failed_rows = todo.loc[res['Match Result'] == 'No Acceptable Match']
+            if len(failed_rows):
+                best = [process.extractOne(c, tables.reference_names, scorer=fuzz.token_sort_ratio)
+                        for c in failed_rows['Cleaned PRODUCTNAME']]
+                best_cand = np.array([[b[2] if b else -1] for b in best], dtype=np.intp)
+                checks = rule_masks(profile.name, row_arrays(failed_rows), tables.refs, best_cand, FAILED_CHECK_RULES)
+                for r, i in enumerate(failed_rows.index):
+                    res.at[i, 'Failed Checks'] = ",".join(name for name, ok in checks.items() if not ok[r, 0])
+        return res
+
+    def _match_row(self, row, profile, tables, candidates, strict_match):
+        raw   = row['PRODUCTNAME']
+        brand = row['BRANDNAME']
+        exact = tables.exact_map
+
+        # exact matches
+        if profile.normalized_names:
+            raw_norm = normalized_name(raw)
+            alt_norm = normalized_name(f"{raw} - {brand}")
+            if raw_norm in exact:
+                return exact[raw_norm], 100, raw_norm, "Matched (Exact Match)"
+            if alt_norm in exact:
+                return exact[alt_norm], 99, alt_norm, "Matched (Exact Match w/ Brand)"
+            # name-only exception keys (no global logic change)
+            for key in _exception_name_keys(raw, brand):
+                if key in exact:
+                    return exact[key], 100, key, "Matched (Exact Match – Name Exception)"
+        else:
+            if raw in exact:
+                return exact[raw], 100, raw, "Matched (Exact Match)"
+            alt_key = f"{raw} - {brand}".strip()
+            if alt_key in exact:
+                return exact[alt_key], 99, alt_key, "Matched (Exact Match w/ Brand)"
+
+        # high-confidence override
+        if profile.confidence_override and candidates and candidates[0][1] == 100:
+            ref = candidates[0][0]
+            return tables.name_to_category[ref], 100, ref, "High-Confidence Override"
+
+        # strict-rule fuzzy matching (picked by the lock-rule engine)
+        if strict_match:
+            return tables.name_to_category[strict_match[0]], strict_match[1], strict_match[0], "Matched (Strict Rules)"
+
+        # edible backup
+        cleaned = row['Cleaned PRODUCTNAME']
+        if row['ProductType'] == 'edible':
+            backups = process.extract(cleaned, self.sop_list, scorer=fuzz.partial_ratio, limit=5)
+            backups = [b for b in backups if b[1] >= PARTIAL_THRESHOLD]
+            if backups:
+                bk = best_match_exact_priority(backups, cleaned)
+                return bk[0], bk[1], bk[0], "Backup S&OP Match"
+
+        return None, None, None, "No Acceptable Match"
+
+# ---------------------- Shared Instance ----------------------
+
+_SHARED_MATCHER = None
+_SHARED_LOCK = threading.Lock()
+
+def shared_retail_matcher() -> RetailMatcher:
+    """The process-wide matcher; PRODUCT_CATALOG is fetched and indexed on first use only (thread-safe)."""
+    global _SHARED_MATCHER
+    with _SHARED_LOCK:
+        if _SHARED_MATCHER is None:
+            _SHARED_MATCHER = RetailMatcher.from_snowflake()
+    return _SHARED_MATCHER
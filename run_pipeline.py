@@ -0,0 +1,107 @@
+import argparse
+import os
+import time
+from functools import partial
+from pipeline_log import get_logger, stage_summary
+from parallel_extract import Stage, StageResult, run_graph, select_stages
+from checkpoints import CHECKPOINTS, RunCheckpoints, activate
+from retail_matcher import shared_retail_matcher
+from retail_inventory_cleaning import run_retail_inventory_cleaning
+from wholesale_inventory_cleaning import run_wholesale_inventory_cleaning
+import merge_outputs
+import merge_inventory
+
+log = get_logger("pipeline")
+
+# ---------------------- Pipeline Graph ----------------------
+# extract + clean/match -> merge -> upload, for sales and inventory, in one process: the catalog
+# and retail matcher are built once and shared, and every branch runs as soon as its inputs are
+# ready. The source stages do not wait for 'catalog'; retail cleaners block on the shared matcher
+# only after their own query has returned.
+
+def load_catalog():
+    """Fetch and index PRODUCT_CATALOG alongside the source queries; the matcher stays in retail_matcher."""
+    shared_retail_matcher()
+
+PIPELINE = {
+    'catalog':             Stage(load_catalog, []),
+    'retail_sales':        Stage(partial(merge_outputs.extract_sales, 'retail_sales'), []),
+    'wholesale_sales':     Stage(partial(merge_outputs.extract_sales, 'wholesale_sales'), []),
+    'retail_inventory':    Stage(run_retail_inventory_cleaning, []),
+    'wholesale_inventory': Stage(run_wholesale_inventory_cleaning, []),
+    'merge_sales':         Stage(merge_outputs.merge_sales, ['retail_sales', 'wholesale_sales']),
+    'merge_inventory':     Stage(merge_inventory.merge_inventory, ['retail_inventory', 'wholesale_inventory']),
+    'upload_sales':        Stage(merge_outputs.upload_sales, ['merge_sales']),
+    'upload_inventory':    Stage(merge_inventory.upload_inventory, ['merge_inventory']),
+}
+
+# --only shorthands; any stage name works too and pulls in what it depends on
+GROUPS = {
+    'sales':     ['upload_sales'],
+    'inventory': ['upload_inventory'],
+}
+
+def main(argv=None) -> int:
+    """Run the selected stages; exit code 1 if any of them failed (the rest are still loaded)."""
+    parser = argparse.ArgumentParser(description="NEA S&OP pipeline: extract, match, merge and upload sales and inventory.")
+    selection = parser.add_mutually_exclusive_group()
+    selection.add_argument("--only", action="append", metavar="STAGE",
+                           help=f"run only these stages and their inputs: {', '.join(GROUPS)} or a stage name "
+                                f"({', '.join(PIPELINE)}); repeat or comma-separate for several")
+    selection.add_argument("--resume", metavar="RUN_ID",
+                           help="rerun a failed run from its checkpoints: completed stages and raw extracts are reused")
+    args = parser.parse_args(argv)
+
+    # --- Run + Checkpoints (checkpoints.py) ---
+    targets = list(PIPELINE)
+    if args.only:
+        targets = [t for arg in args.only for name in arg.split(",") if name.strip()
+                   for t in GROUPS.get(name.strip(), [name.strip()])]
+    run = None
+    if args.resume:
+        run = RunCheckpoints.resume(args.resume)
+        targets = run.manifest["targets"]
+    elif CHECKPOINTS:
+        run = RunCheckpoints.new(targets)
+    graph = select_stages(PIPELINE, targets)
+    done = resumed_stages(run, graph) if args.resume else {}
+    activate(run)
+
+    started = time.perf_counter()
+    log.info("🚀 Running %s%s", ", ".join(n for n in graph if n not in done),
+             f" (run {run.run_id})" if run else "")
+    if done:
+        log.info("♻️ Reused from checkpoints: %s", ", ".join(done))
+    results = run_graph(graph, done=done, on_done=run.save_stage if run else None)
+    failed = [name for name, r in results.items() if r.error is not None]
+    stage_summary(log, "Pipeline", started, stages=len(results), failed=len(failed),
+                  **{name: f"{r.seconds:.1f}s" for name, r in results.items() if r.error is None and name not in done})
+    if failed:
+        log.error("❌ Failed: %s (a failed source is re-extracted next run)", ", ".join(failed))
+        if run:
+            log.error("↩️ Resume from the failed stages with: python run_pipeline.py --resume %s", run.run_id)
+            if os.getenv("GITHUB_RUN_ID"):  # run_merge.yml uploads the checkpoints of a failed job
+                log.error("↩️ In GitHub Actions: run the workflow manually with resume_from=%s", os.environ["GITHUB_RUN_ID"])
+        return 1
+    if run:
+        run.discard()
+    return 0
+
+def resumed_stages(run, graph) -> dict:
+    """
+    StageResults of the stages `run` already completed whose inputs are all reused as well; a
+    stage downstream of one that reruns (e.g. a merge that went ahead without a failed source)
+    reruns too. A stage whose value could not be stored only counts as done when no stage still
+    to run needs it as an input.
+    """
+    stored = run.completed()
+    reused = {}
+    for name, stage in graph.items():  # PIPELINE lists every stage after its inputs
+        if name in stored and all(d in reused for d in stage.deps):
+            reused[name] = stored[name]
+    needed = {d for name in graph if name not in reused for d in graph[name].deps}
+    return {name: StageResult(value, None, 0.0) for name, (kept, value) in reused.items()
+            if kept or name not in needed}
+
+if __name__ == "__main__":
+    raise SystemExit(main())
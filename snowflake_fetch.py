@@ -0,0 +1,88 @@
+import pandas as pd
+from snowflake.connector.errors import NotSupportedError
+from pipeline_log import get_logger
+
+log = get_logger("snowflake")
+
+# ---------------------- Column Types ----------------------
+# Applied to every extract by column name, so the same column has the same dtype whichever
+# view it came from (and whether Arrow sized it int8 or int64 in a given chunk).
+#   float64 - revenue, costs and quantities (nullable, and bulk quantities are fractional)
+#   int64   - counts that are never NULL
+#   date    - datetime.date values, what the DATE output columns and the merges expect
+
+COLUMN_DTYPES = {
+    'TOTAL_REVENUE':      'float64',
+    'AVG_UNIT_COST':      'float64',
+    'WEIGHTSOLD':         'float64',
+    'TOTAL_QUANTITY':     'float64',
+    'QUANTITY':           'float64',
+    'QUANTITYAVAILABLE':  'float64',
+    'QUANTITYONHAND':     'float64',
+    'UNITSPERCASE':       'float64',
+    'TOTAL_TRANSACTIONS': 'int64',
+    'TRANSACTIONDATE':    'date',
+    'INVENTORYDATE':      'date',
+}
+
+def apply_dtypes(df: pd.DataFrame, dtypes: dict = COLUMN_DTYPES) -> pd.DataFrame:
+    for col, kind in dtypes.items():
+        if col not in df.columns:
+            continue
+        if kind == 'date':
+            df[col] = pd.to_datetime(df[col]).dt.date
+        elif kind == 'float64':
+            df[col] = pd.to_numeric(df[col], errors='coerce').astype('float64')
+        else:
+            df[col] = df[col].astype(kind)
+    return df
+
+# ---------------------- Fetch ----------------------
+
+def fetch_frame(cursor, dtypes: dict = COLUMN_DTYPES) -> pd.DataFrame:
+    """
+    Result of the cursor's last execute() as a DataFrame, built from the Arrow result batches
+    (fetch_pandas_all) instead of per-value Python objects, then typed with `dtypes`.
+    Falls back to fetchall() for results Snowflake does not return as Arrow.
+    """
+    columns = [c[0] for c in cursor.description]
+    try:
+        df = cursor.fetch_pandas_all()
+    except NotSupportedError:
+        log.debug("Result not in Arrow format, using fetchall()")
+        df = pd.DataFrame(cursor.fetchall(), columns=columns)
+    if df.empty and list(df.columns) != columns:
+        df = pd.DataFrame(columns=columns)
+    return apply_dtypes(df, dtypes)
+
+def fetch_batches(cursor, min_rows: int = 0, dtypes: dict = COLUMN_DTYPES):
+    """
+    Streams the cursor's last execute() as typed DataFrames, one per Arrow record batch
+    (fetch_pandas_batches). Consecutive batches are combined until they hold at least
+    `min_rows` rows, so per-batch work is not dominated by tiny result chunks.
+    """
+    columns = [c[0] for c in cursor.description]
+    try:
+        batches = cursor.fetch_pandas_batches()
+    except NotSupportedError:
+        log.debug("Result not in Arrow format, streaming with fetchmany()")
+        batches = _fetchmany_batches(cursor, columns, max(min_rows, 10_000))
+
+    pending, pending_rows = [], 0
+    for batch in batches:
+        if batch.empty:
+            continue
+        pending.append(batch)
+        pending_rows += len(batch)
+        if pending_rows >= min_rows:
+            yield apply_dtypes(pd.concat(pending, ignore_index=True) if len(pending) > 1 else pending[0], dtypes)
+            pending, pending_rows = [], 0
+    if pending:
+        yield apply_dtypes(pd.concat(pending, ignore_index=True), dtypes)
+
+def _fetchmany_batches(cursor, columns, size):
+    while True:
+        rows = cursor.fetchmany(size)
+        if not rows:
+            return
+        yield pd.DataFrame(rows, columns=columns)
@@ -0,0 +1,104 @@
+import atexit
+import os
+import threading
+import snowflake.connector
+from dotenv import load_dotenv
+from pipeline_log import get_logger
+
+load_dotenv()
+
+log = get_logger("snowflake")
+
+# ——— PARAMETERS ———
+# snowflake: the live accounts below. local: DuckDB files + Parquet fixtures (local_backend.py), same
+# profiles and SQL, no credentials needed, for offline runs, profiling and benchmarks.
+PIPELINE_BACKEND = os.getenv("PIPELINE_BACKEND", "snowflake").strip().lower()
+
+# ---------------------- Connection Profiles ----------------------
+# One connection per credential set, opened on first use and shared by every stage in the
+# process (extracts, catalog probe, uploads). Session statements run once per connection.
+
+CONNECTION_PROFILES = {
+    # read-only NEA account: retail sales/inventory and wholesale views (queries use NEA_SALES.<schema>.<view>)
+    'source': {
+        'env': ('NEA_SF_USER', 'NEA_SF_PASS', 'NEA_SF_ACCT'),
+        'params': dict(role="READ_ONLY_NEA", warehouse="COMPUTE_WH", database="NEA_SALES", schema="PUBLIC"),
+        'session': ["ALTER SESSION SET USE_CACHED_RESULT = FALSE"],
+    },
+    # forecasting account: PRODUCT_CATALOG and the output tables
+    'target': {
+        'env': ('MY_SF_USER', 'MY_SF_PASS', 'MY_SF_ACCT'),
+        'params': dict(warehouse="COMPUTE_WH", database="NEA_FORECASTING", schema="PUBLIC"),
+        'session': [],
+    },
+}
+
+# ---------------------- Session Manager ----------------------
+
+class SnowflakeSessions:
+    """
+    Lazily opened, process-wide Snowflake connections keyed by profile name. `connect`
+    defaults to the PIPELINE_BACKEND connector; pass any callable taking the same keyword
+    arguments as snowflake.connector.connect (e.g. a fake) to run the pipeline without Snowflake.
+    Every extract and upload goes through these connections, so that is the one place the
+    source and sink backends are chosen.
+    """
+
+    def __init__(self, connect=None, profiles=CONNECTION_PROFILES):
+        self.connect = connect
+        self.profiles = profiles
+        self._conns = {}
+        self._lock = threading.Lock()  # concurrent extract stages share one connection per profile
+
+    def get(self, name: str):
+        with self._lock:
+            return self._open(name)
+
+    def _open(self, name: str):
+        conn = self._conns.get(name)
+        if conn is not None and not getattr(conn, "is_closed", lambda: False)():
+            return conn
+        profile = self.profiles[name]
+        user, password, account = (os.getenv(v) for v in profile['env'])
+        connect = self.connect or backend_connector()
+        conn = connect(user=user, password=password, account=account, **profile['params'])
+        with conn.cursor() as cs:
+            for statement in profile['session']:
+                cs.execute(statement)
+        log.debug("Opened %s session '%s' (%s)", PIPELINE_BACKEND, name, profile['params'].get('database'))
+        self._conns[name] = conn
+        return conn
+
+    def close_all(self):
+        with self._lock:
+            self._close_all()
+
+    def _close_all(self):
+        for name, conn in list(self._conns.items()):
+            try:
+                conn.close()
+            except Exception as e:
+                log.warning("⚠️ Closing Snowflake session '%s' failed: %s", name, e)
+        self._conns.clear()
+
+def backend_connector(backend: str = None):
+    """connect callable for `backend` (default PIPELINE_BACKEND): 'snowflake' or 'local'."""
+    backend = backend or PIPELINE_BACKEND
+    if backend == "snowflake":
+        return snowflake.connector.connect
+    if backend == "local":
+        import local_backend  # duckdb is only needed for local runs
+        return local_backend.connect
+    raise ValueError(f"PIPELINE_BACKEND must be 'snowflake' or 'local', got {backend!r}")
+
+SESSIONS = SnowflakeSessions()
+atexit.register(SESSIONS.close_all)  # forked match workers leave via os._exit, so only the parent closes
+
+def get_connection(name: str):
+    """Shared connection for 'source' (NEA_SF_*) or 'target' (MY_SF_*)."""
+    return SESSIONS.get(name)
+
+def use_connector(connect):
+    """Swap the connect callable (tests / local fakes); open sessions are closed first."""
+    SESSIONS.close_all()
+    SESSIONS.connect = connect
@@ -0,0 +1,128 @@
+import os
+import threading
+import uuid
+from collections import namedtuple
+import pandas as pd
+from bulk_loader import bulk_load, log_throughput
+from extract_queries import Filter
+from pipeline_log import get_logger
+
+log = get_logger("upload")
+
+# ——— PARAMETERS ———
+# merge: delete + insert the scoped partitions in one transaction on the live table
+# swap:  rebuild a zero-copy clone of the table and ALTER TABLE ... SWAP it into place
+LOAD_MODE = os.getenv("LOAD_MODE", "merge").strip().lower()
+
+# A Snowflake session has one open transaction and DDL commits it, so concurrent upload stages
+# sharing the target session take turns for their whole stage + apply sequence.
+WRITE_LOCK = threading.RLock()
+
+UpsertReport = namedtuple("UpsertReport", ["inserted", "updated", "unchanged", "removed"])
+
+def _ident(col: str) -> str:
+    """Quoted identifier, as write_pandas creates them (e.g. "Matched S&OP Category")."""
+    return '"' + col.replace('"', '""') + '"'
+
+def _same_key(keys, a: str, b: str) -> str:
+    """Join condition matching rows of `a` and `b` on every key, NULL keys included."""
+    return " AND ".join(f"{a}.{_ident(k)} IS NOT DISTINCT FROM {b}.{_ident(k)}" for k in keys)
+
+# ---------------------- Partition Upsert ----------------------
+# The frame is bulk loaded into a temporary copy of the target (bulk_loader.py), then the
+# partitions it owns are replaced atomically (LOAD_MODE), so readers see either the old rows
+# or the new ones, never a half-emptied table. Rows are compared by key (location/date/product)
+# and full-row hash to report what actually changed.
+
+def upsert_partitions(conn, df: pd.DataFrame, table_name: str, keys, scope, mode: str = LOAD_MODE) -> UpsertReport:
+    """
+    Replace the rows of `table_name` matched by any `scope` Filter (e.g. one source's date range)
+    with `df`. Staged rows whose full row already exists are "unchanged", rows whose key exists
+    with different values "updated", the rest "inserted"; scoped target rows whose key is no
+    longer staged are "removed". Without a scope the frame is only appended.
+    """
+    if mode not in ("merge", "swap"):
+        raise ValueError(f"LOAD_MODE must be 'merge' or 'swap', got {mode!r}")
+    table_name = table_name.upper()
+    # per-load suffix, so overlapping loads of one table (manual + nightly run) never share a staging table
+    load_id = uuid.uuid4().hex[:8].upper()
+    stage = f"{table_name}_STAGE_{load_id}"
+    columns = ", ".join(_ident(c) for c in df.columns)
+    key_cols = ", ".join(_ident(k) for k in keys)
+    where = " OR ".join(f"({f.sql})" for f in scope) or "FALSE"
+    params = tuple(p for f in scope for p in f.params)
+
+    with WRITE_LOCK, conn.cursor() as cs:
+        # DDL and the staging COPY commit on their own, so they run before the swap / transaction
+        cs.execute(f"CREATE TEMPORARY TABLE {stage} LIKE {table_name}")
+        try:
+            log_throughput(bulk_load(conn, df, stage), label=table_name)
+
+            # LEFT JOINs rather than EXISTS in the projection, which Snowflake only allows in WHERE
+            cs.execute(f"""
+                WITH s AS (SELECT {key_cols}, HASH({columns}) AS ROW_HASH FROM {stage}),
+                     t AS (SELECT {key_cols}, HASH({columns}) AS ROW_HASH FROM {table_name} WHERE {where}),
+                     t_rows AS (SELECT DISTINCT ROW_HASH FROM t),
+                     t_keys AS (SELECT DISTINCT {key_cols}, TRUE AS HIT FROM t),
+                     s_keys AS (SELECT DISTINCT {key_cols}, TRUE AS HIT FROM s),
+                     staged AS (
+                         SELECT
+                             COUNT_IF(r.ROW_HASH IS NULL AND k.HIT IS NULL) AS INSERTED,
+                             COUNT_IF(r.ROW_HASH IS NULL AND k.HIT IS NOT NULL) AS UPDATED,
+                             COUNT_IF(r.ROW_HASH IS NOT NULL) AS UNCHANGED
+                         FROM s
+                         LEFT JOIN t_rows r ON r.ROW_HASH = s.ROW_HASH
+                         LEFT JOIN t_keys k ON {_same_key(keys, 's', 'k')}
+                     ),
+                     removed AS (
+                         SELECT COUNT(*) AS REMOVED
+                         FROM t LEFT JOIN s_keys k ON {_same_key(keys, 't', 'k')}
+                         WHERE k.HIT IS NULL
+                     )
+                SELECT INSERTED, UPDATED, UNCHANGED, REMOVED FROM staged, removed
+            """, params)
+            report = UpsertReport(*(int(n or 0) for n in cs.fetchone()))
+
+            if mode == "swap":
+                _swap_in(cs, table_name, f"{table_name}_SHADOW_{load_id}", stage, columns, where, params, scope)
+            else:
+                _merge_in(cs, table_name, stage, columns, where, params, scope)
+        finally:
+            cs.execute(f"DROP TABLE IF EXISTS {stage}")
+
+    log.info("✅ Upserted %s: %d inserted, %d updated, %d unchanged, %d removed",
+             table_name, report.inserted, report.updated, report.unchanged, report.removed)
+    return report
+
+def _merge_in(cs, table_name, stage, columns, where, params, scope):
+    cs.execute("BEGIN")
+    try:
+        if scope:
+            cs.execute(f"DELETE FROM {table_name} WHERE {where}", params)
+        cs.execute(f"INSERT INTO {table_name} ({columns}) SELECT {columns} FROM {stage}")
+        cs.execute("COMMIT")
+    except Exception:
+        cs.execute("ROLLBACK")
+        raise
+
+def _swap_in(cs, table_name, shadow, stage, columns, where, params, scope):
+    # the live table is untouched until the metadata-only SWAP; writes to it in between are lost
+    cs.execute(f"CREATE OR REPLACE TABLE {shadow} CLONE {table_name} COPY GRANTS")
+    try:
+        if scope:
+            cs.execute(f"DELETE FROM {shadow} WHERE {where}", params)
+        cs.execute(f"INSERT INTO {shadow} ({columns}) SELECT {columns} FROM {stage}")
+        cs.execute(f"ALTER TABLE {table_name} SWAP WITH {shadow}")
+    finally:
+        cs.execute(f"DROP TABLE IF EXISTS {shadow}")
+
+# ---------------------- Scopes ----------------------
+
+def date_scope(date_column: str, dates, source_filter: str) -> Filter:
+    """Rows of one source (`source_filter`) on the given `dates`."""
+    placeholders = ", ".join(["%s"] * len(dates))
+    return Filter(f"{date_column} IN ({placeholders}) AND {source_filter}", tuple(dates))
+
+def range_scope(date_column: str, start_date, end_date, source_filter: str) -> Filter:
+    """Rows of one source (`source_filter`) from `start_date` through `end_date`."""
+    return Filter(f"{date_column} BETWEEN %s AND %s AND {source_filter}", (start_date, end_date))
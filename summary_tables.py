@@ -0,0 +1,79 @@
+from collections import namedtuple
+from extract_queries import in_list
+from pipeline_log import get_logger
+from snowflake_upsert import WRITE_LOCK
+
+log = get_logger("summaries")
+
+# ---------------------- Summary Tables ----------------------
+# Pre-aggregated copies of the matched sales detail for the dashboards. They are rebuilt inside
+# Snowflake from the detail table after it is upserted, so retail and wholesale are summed together
+# and rows outside this run's extract windows are still counted. Only touched partitions are rebuilt:
+#   DAILY_CATEGORY_SUMMARY   - the re-extracted date range of each loaded source
+#   MATCHED_CATEGORY_SUMMARY - all-time totals of every category that gained or lost detail rows
+
+DETAIL_TABLE = "MATCHED_SALES_WITH_SNOP_CATEGORY"
+CATEGORY = '"Matched S&OP Category"'
+MEASURES = ["TOTAL_QUANTITY", "TOTAL_REVENUE"]
+
+Summary = namedtuple("Summary", ["table", "keys"])
+
+DAILY_SUMMARY = Summary("DAILY_CATEGORY_SUMMARY", ["LOCATIONNAME", "TRANSACTIONDATE", CATEGORY])
+CATEGORY_SUMMARY = Summary("MATCHED_CATEGORY_SUMMARY", [CATEGORY, "PRODUCTNAME"])
+
+def touched_categories(conn, scope, matched_df) -> list:
+    """
+    Categories whose totals this run can change: those in `matched_df` plus those of the detail
+    rows currently inside `scope` (they are about to be replaced). Call before the detail upsert.
+    """
+    categories = set(matched_df["Matched S&OP Category"].dropna()) if "Matched S&OP Category" in matched_df else set()
+    if scope:
+        where = " OR ".join(f"({f.sql})" for f in scope)
+        with conn.cursor() as cs:
+            try:
+                cs.execute(f"SELECT DISTINCT {CATEGORY} FROM {DETAIL_TABLE} WHERE {where}",
+                           tuple(p for f in scope for p in f.params))
+                categories.update(c for (c,) in cs.fetchall() if c is not None)
+            except Exception as e:  # first run: no detail table yet, nothing to replace
+                log.debug("No existing detail categories (%s)", e)
+    return sorted(categories)
+
+def refresh_summaries(conn, date_scope, categories):
+    """
+    Rebuild the DAILY_CATEGORY_SUMMARY rows inside `date_scope` (Filters on TRANSACTIONDATE +
+    source, as used for the detail upsert) and the MATCHED_CATEGORY_SUMMARY rows of `categories`
+    from the detail table, in one transaction. Creates the summary tables on first use.
+    """
+    refreshes = [(DAILY_SUMMARY, list(date_scope))]
+    if categories:
+        refreshes.append((CATEGORY_SUMMARY, [in_list(CATEGORY, categories)]))
+
+    with WRITE_LOCK, conn.cursor() as cs:
+        for summary, _ in refreshes:
+            cs.execute(f"CREATE TABLE IF NOT EXISTS {summary.table} AS {_aggregate(summary, 'FALSE')}")
+
+        cs.execute("BEGIN")
+        try:
+            written = {}
+            for summary, scope in refreshes:
+                where = " OR ".join(f"({f.sql})" for f in scope) or "FALSE"
+                params = tuple(p for f in scope for p in f.params)
+                cs.execute(f"DELETE FROM {summary.table} WHERE {where}", params)
+                columns = ", ".join(summary.keys + MEASURES)
+                cs.execute(f"INSERT INTO {summary.table} ({columns}) {_aggregate(summary, where)}", params)
+                cs.execute(f"SELECT COUNT(*) FROM {summary.table} WHERE {where}", params)
+                written[summary.table] = cs.fetchone()[0]
+            cs.execute("COMMIT")
+        except Exception:
+            cs.execute("ROLLBACK")
+            raise
+
+    log.info("✅ Refreshed summaries: %s rows in %s, %s rows for %d categories in %s",
+             written[DAILY_SUMMARY.table], DAILY_SUMMARY.table,
+             written.get(CATEGORY_SUMMARY.table, 0), len(categories), CATEGORY_SUMMARY.table)
+    return written
+
+def _aggregate(summary: Summary, where: str) -> str:
+    keys = ", ".join(summary.keys)
+    sums = ", ".join(f"SUM({m}) AS {m}" for m in MEASURES)
+    return f"SELECT {keys}, {sums} FROM {DETAIL_TABLE} WHERE {where} GROUP BY {keys}"
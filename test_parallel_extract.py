@@ -0,0 +1,51 @@
+import threading
+import time
+from parallel_extract import Stage, run_graph
+
+# Stage graph scheduling: failures, timeouts and their dependents.
+
+def sleeper(seconds, value=None):
+    def fn(*inputs):
+        time.sleep(seconds)
+        return value
+    return fn
+
+def test_timeout_counts_from_stage_start():
+    graph = {'a': Stage(sleeper(0.3, 1), []), 'b': Stage(sleeper(0.3, 2), [])}
+    results = run_graph(graph, workers=1, timeout=0.5)  # b waits 0.3s for the only worker
+    assert {n: (r.value, r.error) for n, r in results.items()} == {'a': (1, None), 'b': (2, None)}
+
+def test_timed_out_stage_blocks_its_dependents():
+    release = threading.Event()
+    graph = {
+        'extract': Stage(lambda: release.wait(5), []),
+        'other': Stage(sleeper(0, "ok"), []),
+        'merge': Stage(lambda *inputs: "merged", ['extract', 'other']),
+    }
+    started = time.perf_counter()
+    results = run_graph(graph, workers=1, timeout=0.2)
+    assert time.perf_counter() - started < 2
+    assert isinstance(results['extract'].error, TimeoutError)
+    assert results['other'].value == "ok"
+    assert results['merge'].error is not None  # not run beside a stage that may still finish
+    # abandoned, not joined: the process can exit while it hangs
+    assert [t.daemon for t in threading.enumerate() if t.name == "stage-extract"] == [True]
+    release.set()
+
+def test_failed_input_still_runs_a_merge_with_the_others():
+    def boom():
+        raise RuntimeError("down")
+    graph = {'a': Stage(boom, []), 'b': Stage(sleeper(0, 2), []),
+             'merge': Stage(lambda a, b: [r.value for r in (a, b) if r.error is None], ['a', 'b'])}
+    done = []
+    results = run_graph(graph, workers=2, timeout=5, on_done=lambda name, r: done.append(name))
+    assert results['merge'].value == [2]
+    assert sorted(done) == ['b', 'merge']
+
+def test_failed_stage_is_timed_from_its_own_start():
+    def boom():
+        raise RuntimeError("down")
+    graph = {'a': Stage(sleeper(0.3, 1), []), 'b': Stage(boom, [])}
+    results = run_graph(graph, workers=1, timeout=5)  # b starts once a has run for 0.3s
+    assert isinstance(results['b'].error, RuntimeError)
+    assert results['b'].seconds < 0.2
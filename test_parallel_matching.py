@@ -0,0 +1,36 @@
+import threading
+import pandas as pd
+import parallel_matching
+from parallel_matching import parallel_match
+
+# Sharded matching from concurrent pipeline stages (retail_sales + retail_inventory both match).
+
+def tagged(tag):
+    return lambda part, threads: pd.DataFrame({'tag': tag, 'value': part['value'] * 2}, index=part.index)
+
+def test_concurrent_calls_keep_their_own_match_function(monkeypatch):
+    monkeypatch.setattr(parallel_matching, "MIN_SHARD_ROWS", 10)
+    frames = {tag: pd.DataFrame({'value': range(100)}) for tag in ("sales", "inventory")}
+    results, errors = {}, []
+
+    def run(tag):
+        try:
+            results[tag] = parallel_match(tagged(tag), frames[tag], workers=4)
+        except Exception as e:  # a worker reading the other call's state fails or mixes rows
+            errors.append(e)
+
+    for _ in range(3):
+        threads = [threading.Thread(target=run, args=(tag,)) for tag in frames]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert not errors
+        for tag, result in results.items():
+            assert set(result['tag']) == {tag}
+            assert result['value'].tolist() == [2 * v for v in range(100)]
+
+def test_workers_do_not_leave_state_in_parent(monkeypatch):
+    monkeypatch.setattr(parallel_matching, "MIN_SHARD_ROWS", 10)
+    parallel_match(tagged("x"), pd.DataFrame({'value': range(40)}), workers=2)
+    assert parallel_matching._SHARED is None
@@ -0,0 +1,229 @@
+import datetime
+import os
+import pandas as pd
+import pytest
+import checkpoints
+import local_backend
+import merge_inventory
+import merge_outputs
+import retail_matcher
+import run_pipeline
+import watermarks
+from parallel_extract import StageResult
+from snowflake_sessions import get_connection, use_connector
+
+# Extract -> merge -> upload against the local DuckDB backend (local_backend.py) through the
+# injectable session connector, with small warehouse fixtures written per test. Every relative
+# output path (match cache, watermarks, checkpoints, run archives) lands in the test's tmp folder.
+
+TODAY = datetime.date.today()
+DAY = datetime.timedelta(days=1)
+
+CATALOG = pd.DataFrame({
+    'PRODUCTNAME': ["Blue Dream Hybrid Flower 3.5g", "OG Kush Indica Flower 3.5g", "Watermelon Gummies 100mg"],
+    'SNOPCATEGORY': ["NEA Premium Flower Hybrid 3.5g", "NEA Fire Flower Indica 3.5g", "Edible Watermelon Gummies"],
+    'Brand': ["NEA Premium", "NEA Fire", "Cannatini"],
+})
+
+def retail_sales():
+    rows = [
+        ("Fall River", 1, "Blue Dream Hybrid Flower 3.5g", "NEA Premium", TODAY - 2 * DAY, 3, 90.0),
+        ("Seekonk",    2, "og kush indica flower 3.5g",    "NEA Fire",    TODAY - 2 * DAY, 1, 35.0),
+        ("Seekonk",    2, "og kush indica flower 3.5g",    "NEA Fire",    TODAY - 1 * DAY, 2, 70.0),
+        ("Fall River", 3, "Mystery Item",                  "Sapura",      TODAY - 1 * DAY, 5, 10.0),
+        ("Fall River", 4, "Competitor Flower 3.5g",        "Other Co",    TODAY - 1 * DAY, 1, 30.0),
+    ]
+    df = pd.DataFrame(rows, columns=['LOCATIONNAME', 'PRODUCTID', 'PRODUCTNAME', 'BRANDNAME', 'TRANSACTIONDATE',
+                                     'QUANTITY', 'NETSALEFORITEM'])
+    return df.assign(SKU="SKU", MASTERCATEGORY="NEA Flower", PRODUCTGRAMS=3.5, CATEGORY="Flower",
+                     TRANSACTIONID=range(len(df)), UNITCOST=4.2, TRANSACTIONTYPE="Retail",
+                     RETURNDATE=pd.NaT, ISVOID="false")
+
+def wholesale_sales():
+    return pd.DataFrame({
+        'DELIVERYDATE': [TODAY - 3 * DAY, TODAY - DAY],
+        'PRODUCTNAME': ["NEA Fire Bulk Flower", "Gummies 10pk"],
+        'BRAND': ["NEA Fire", "Cannatini"],
+        'PRODUCTSKU': ["NEA Fire Bulk Flower g", None],
+        'WEIGHTUNIT': ["Grams", "Units"],
+        'UNITSPERCASE': [1.0, 10.0],
+        'BUYERNAME': ["Dispensary A", "Dispensary B"],
+        'QUANTITY': [2.0, 4.0],
+        'LINETOTAL': [800.0, 120.0],
+    })
+
+def retail_inventory():
+    return pd.DataFrame({
+        'LOCATIONNAME': ["Fall River", "Seekonk"], 'PRODUCTID': [1, 2],
+        'PRODUCTNAME': ["Blue Dream Hybrid Flower 3.5g", "Mystery Item"], 'SKU': "SKU",
+        'MASTERCATEGORY': "NEA Flower", 'BRANDNAME': ["NEA Premium", "Sapura"], 'PRODUCTGRAMS': 3.5,
+        'CATEGORY': "Flower", 'QUANTITYAVAILABLE': [12, 4], 'INVENTORYDATE': TODAY,
+    })
+
+def wholesale_inventory():
+    return pd.DataFrame({
+        'PRODUCTNAME': ["NEA Fire Trim", "Gummies 10pk"], 'BRAND': ["NEA Fire", "Cannatini"],
+        'PRODUCTSKU': [None, "Edible Watermelon Gummies"],
+        'UNITSIZE': [None, 3.5],  # numeric in the warehouse
+        'UNITSPERCASE': [1.0, 10.0], 'INVENTORYDATE': TODAY, 'QUANTITY': [1.0, 3.0], 'PRODUCTARCHIVED': False,
+    })
+
+FIXTURES = {
+    ('NEA_SALES', 'PUBLIC', 'VSALES'): retail_sales,
+    ('NEA_SALES', 'PUBLIC', 'VRETAILINVENTORY'): retail_inventory,
+    ('NEA_SALES', 'WHOLESALE', 'VWHOLESALESALES'): wholesale_sales,
+    ('NEA_SALES', 'WHOLESALE', 'VWHOLESALEPRODUCTS'): wholesale_inventory,
+    ('NEA_FORECASTING', 'PUBLIC', 'PRODUCT_CATALOG'): lambda: CATALOG,
+}
+
+@pytest.fixture
+def warehouse(tmp_path, monkeypatch):
+    """Local backend with every fixture view; yields a function running SQL on the target database."""
+    fixture_dir = tmp_path / "fixtures"
+    for (database, schema, view), build in FIXTURES.items():
+        folder = fixture_dir / database / schema
+        folder.mkdir(parents=True, exist_ok=True)
+        build().to_parquet(folder / f"{view}.parquet", index=False)
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(local_backend, "LOCAL_DB_DIR", str(tmp_path / "db"))
+    monkeypatch.setattr(local_backend, "LOCAL_FIXTURE_DIR", str(fixture_dir))
+    monkeypatch.setattr(watermarks, "INCREMENTAL", False)
+    monkeypatch.setattr(retail_matcher, "_SHARED_MATCHER", None)
+    monkeypatch.setattr(checkpoints, "_ACTIVE", None)
+    use_connector(local_backend.connect)
+
+    def query(sql):
+        with get_connection('target').cursor() as cs:
+            return cs.execute(sql).fetch_pandas_all()
+    yield query
+    use_connector(None)
+
+def test_extract_sales_matches_and_splits(warehouse):
+    extract = merge_outputs.extract_sales('retail_sales')
+    assert extract.window == (TODAY - 90 * DAY, TODAY)
+    matched = extract.matched.set_index('PRODUCTNAME')
+    assert matched.loc["Blue Dream Hybrid Flower 3.5g", 'Matched S&OP Category'] == "NEA Premium Flower Hybrid 3.5g"
+    assert set(matched.loc["og kush indica flower 3.5g", 'Match Result']) == {"Matched (Strict Rules)"}
+    results = dict(zip(extract.unmatched['PRODUCTNAME'], extract.unmatched['Match Result']))
+    assert results == {"Mystery Item": "No Acceptable Match", "Competitor Flower 3.5g": "Wrong Brand"}
+
+def test_merge_and_upload_sales(warehouse):
+    extracts = [StageResult(merge_outputs.extract_sales(source), None, 0.0)
+                for source in ('retail_sales', 'wholesale_sales')]
+    merge = merge_outputs.merge_sales(*extracts)
+    assert list(merge.matched.columns) == [c for c in merge_outputs.OUTPUT_COLUMNS if c in merge.matched.columns]
+    merge_outputs.upload_sales(StageResult(merge, None, 0.0))
+
+    detail = warehouse("SELECT * FROM MATCHED_SALES_WITH_SNOP_CATEGORY")
+    assert len(detail) == len(merge.matched) == 4
+    assert detail['TOTAL_QUANTITY'].sum() == pytest.approx(3 + 1 + 2 + 2 * 453.6)  # wholesale bulk: pounds -> grams
+    daily = warehouse("SELECT * FROM DAILY_CATEGORY_SUMMARY")
+    expected = detail.groupby(['LOCATIONNAME', 'TRANSACTIONDATE', 'Matched S&OP Category'])['TOTAL_REVENUE'].sum()
+    assert daily.groupby(['LOCATIONNAME', 'TRANSACTIONDATE', 'Matched S&OP Category'])['TOTAL_REVENUE'].sum() \
+        .sort_index().tolist() == pytest.approx(expected.sort_index().tolist())
+    # a watermark per loaded source, saved only after the upload
+    assert set(watermarks.load_watermarks(watermarks.WATERMARK_PATH)) == {'retail_sales', 'wholesale_sales'}
+
+def test_merge_sales_without_failed_source(warehouse):
+    retail = StageResult(merge_outputs.extract_sales('retail_sales'), None, 0.0)
+    failed = StageResult(None, RuntimeError("wholesale down"), 0.0)
+    merge = merge_outputs.merge_sales(retail, failed)
+    assert set(merge.windows) == {'retail_sales'}
+    assert set(merge.matched['LOCATIONNAME']) == {"Fall River", "Seekonk"}
+
+def test_merge_and_upload_inventory(warehouse):
+    from retail_inventory_cleaning import run_retail_inventory_cleaning
+    from wholesale_inventory_cleaning import run_wholesale_inventory_cleaning
+    retail = StageResult(run_retail_inventory_cleaning(), None, 0.0)
+    wholesale = StageResult(run_wholesale_inventory_cleaning(), None, 0.0)
+    matched, unmatched = merge_inventory.merge_inventory(retail, wholesale)
+    merge_inventory.upload_inventory(StageResult((matched, unmatched), None, 0.0))
+
+    loaded = warehouse("SELECT * FROM MATCHED_INVENTORY_WITH_SNOP_CATEGORY").set_index('PRODUCTNAME')
+    assert loaded.loc["Gummies 10pk", 'TOTAL_QUANTITY'] == 30.0
+    assert loaded.loc["NEA Fire Trim", 'Match Result'] == "Trim Override"
+    assert loaded.loc["NEA Fire Trim", 'TOTAL_QUANTITY'] == pytest.approx(453.6)
+    assert "Mystery Item" in set(warehouse("SELECT PRODUCTNAME FROM UNMATCHED_INVENTORY_WITHOUT_SNOP_CATEGORY")['PRODUCTNAME'])
+
+def test_pipeline_loads_what_extracted(warehouse):
+    os.remove(os.path.join(local_backend.LOCAL_FIXTURE_DIR, "NEA_SALES", "WHOLESALE", "VWHOLESALESALES.parquet"))
+    assert run_pipeline.main([]) == 1  # wholesale sales failed, everything else is loaded
+    sources = set(warehouse("SELECT DISTINCT LOCATIONNAME FROM MATCHED_SALES_WITH_SNOP_CATEGORY")['LOCATIONNAME'])
+    assert "Wholesale" not in sources and sources
+    assert len(warehouse("SELECT * FROM MATCHED_INVENTORY_WITH_SNOP_CATEGORY")) == 3
+
+def test_swap_load_uses_its_own_shadow_table(warehouse, monkeypatch):
+    from snowflake_upsert import upsert_partitions, range_scope
+    statements = []
+    conn = get_connection('target')
+    cursor = conn.cursor
+    def recording_cursor():
+        cs = cursor()
+        execute = cs.execute
+        cs.execute = lambda sql, *args, **kwargs: (statements.append(sql), execute(sql, *args, **kwargs))[1]
+        return cs
+    monkeypatch.setattr(conn, "cursor", recording_cursor)
+
+    df = pd.DataFrame({'LOCATIONNAME': ["Seekonk"], 'TRANSACTIONDATE': [TODAY], 'PRODUCTNAME': ["A"], 'TOTAL_QUANTITY': [1.0]})
+    scope = [range_scope("TRANSACTIONDATE", TODAY, TODAY, "TRUE")]
+    keys = ['LOCATIONNAME', 'TRANSACTIONDATE', 'PRODUCTNAME']
+    upsert_partitions(conn, df, "SWAP_TARGET", keys, [])
+    upsert_partitions(conn, df.assign(TOTAL_QUANTITY=2.0), "SWAP_TARGET", keys, scope, mode="swap")
+    upsert_partitions(conn, df.assign(TOTAL_QUANTITY=3.0), "SWAP_TARGET", keys, scope, mode="swap")
+
+    shadows = [s.split()[4] for s in statements if s.startswith("CREATE OR REPLACE TABLE SWAP_TARGET_SHADOW")]
+    assert len(shadows) == len(set(shadows)) == 2
+    assert warehouse("SELECT TOTAL_QUANTITY FROM SWAP_TARGET")['TOTAL_QUANTITY'].tolist() == [3.0]
+    assert warehouse("SELECT COUNT(*) AS N FROM duckdb_tables() WHERE table_name LIKE 'SWAP_TARGET_%'")['N'][0] == 0
+
+def test_upsert_reports_what_changed(warehouse):
+    from snowflake_upsert import upsert_partitions, range_scope, UpsertReport
+    conn = get_connection('target')
+    keys = ['LOCATIONNAME', 'TRANSACTIONDATE', 'PRODUCTNAME']
+    first = pd.DataFrame({'LOCATIONNAME': ["Seekonk", "Seekonk", None], 'TRANSACTIONDATE': TODAY,
+                          'PRODUCTNAME': ["A", "B", "C"], 'TOTAL_QUANTITY': [1.0, 2.0, 3.0]})
+    assert upsert_partitions(conn, first, "REPORT_TARGET", keys, []) == UpsertReport(3, 0, 0, 0)
+    second = pd.DataFrame({'LOCATIONNAME': ["Seekonk", None, "Seekonk"], 'TRANSACTIONDATE': TODAY,
+                           'PRODUCTNAME': ["A", "C", "D"], 'TOTAL_QUANTITY': [1.0, 4.0, 5.0]})
+    scope = [range_scope("TRANSACTIONDATE", TODAY, TODAY, "TRUE")]
+    # A unchanged, C (NULL location) updated, D inserted, B removed
+    assert upsert_partitions(conn, second, "REPORT_TARGET", keys, scope) == UpsertReport(1, 1, 1, 1)
+
+def test_resume_reruns_only_what_failed(warehouse, monkeypatch, caplog):
+    import logging
+    nea = logging.getLogger("nea")
+    monkeypatch.setattr(nea, "handlers", nea.handlers + [caplog.handler])  # pipeline loggers do not propagate to root
+    monkeypatch.setattr(caplog.handler, "level", logging.INFO)
+    missing = os.path.join(local_backend.LOCAL_FIXTURE_DIR, "NEA_SALES", "WHOLESALE", "VWHOLESALESALES.parquet")
+    os.rename(missing, missing + ".off")
+    try:
+        assert run_pipeline.main([]) == 1
+    finally:
+        os.rename(missing + ".off", missing)
+    run_id = checkpoints._ACTIVE.run_id
+    assert not [r for r in caplog.records if "not checkpointed" in r.getMessage()]
+
+    caplog.clear()
+    use_connector(local_backend.connect)  # a new process: sessions reopen and see the restored view
+    assert run_pipeline.main(["--resume", run_id]) == 0
+    reused = next(r.getMessage() for r in caplog.records if "Reused from checkpoints" in r.getMessage())
+    assert {'catalog', 'retail_sales', 'merge_inventory', 'upload_inventory'} <= set(reused.split(": ")[1].split(", "))
+    assert "Wholesale" in set(warehouse("SELECT LOCATIONNAME FROM MATCHED_SALES_WITH_SNOP_CATEGORY")['LOCATIONNAME'])
+    assert not os.path.exists(checkpoints._ACTIVE.folder)  # a run that succeeds discards its checkpoints
+
+def test_inventory_with_one_source_keeps_the_table_schema(warehouse):
+    assert run_pipeline.main(["--only", "inventory"]) == 0
+    columns = list(warehouse("SELECT * FROM MATCHED_INVENTORY_WITH_SNOP_CATEGORY").columns)
+    for schema, view, survivors in [("PUBLIC", "VRETAILINVENTORY", ["Wholesale", "Wholesale"]),
+                                    ("WHOLESALE", "VWHOLESALEPRODUCTS", ["Fall River"])]:
+        warehouse("DELETE FROM MATCHED_INVENTORY_WITH_SNOP_CATEGORY")
+        path = os.path.join(local_backend.LOCAL_FIXTURE_DIR, "NEA_SALES", schema, f"{view}.parquet")
+        os.rename(path, path + ".off")
+        try:
+            assert run_pipeline.main(["--only", "inventory"]) == 1  # the other source still loads
+        finally:
+            os.rename(path + ".off", path)
+        loaded = warehouse("SELECT * FROM MATCHED_INVENTORY_WITH_SNOP_CATEGORY")
+        assert list(loaded.columns) == columns
+        assert sorted(loaded['LOCATIONNAME']) == survivors
@@ -0,0 +1,35 @@
+import numpy as np
+import pandas as pd
+from product_rules import convert_to_units
+
+# Wholesale unit conversion against the row-by-row rules it replaced.
+
+def test_inventory_ignores_numeric_unitsize():
+    frame = pd.DataFrame({
+        'PRODUCTNAME': ['NEA Fire Bulk Flower', 'Gummies 10pk', 'Vape Cart'],
+        'QUANTITYONHAND': [2.0, 3.0, None],
+        'UNITSPERCASE': [None, 10.0, 4.0],
+        'WEIGHTUNIT': [3.5, None, 1.0],  # UNITSIZE AS WEIGHTUNIT, numeric in the extract
+    })
+    units = convert_to_units(frame, 'wholesale_inventory')
+    assert units.tolist() == [2.0 * 453.6, 30.0, 0.0]
+
+def test_inventory_mixed_unitsize_is_not_unreadable():
+    frame = pd.DataFrame({
+        'PRODUCTNAME': ['Trim', 'Chocolate'],
+        'QUANTITYONHAND': [1.0, 2.0],
+        'UNITSPERCASE': [1.0, 6.0],
+        'WEIGHTUNIT': pd.Series(['Grams', 28.0], dtype=object),
+    })
+    assert convert_to_units(frame, 'wholesale_inventory').tolist() == [453.6, 12.0]
+
+def test_sales_weight_units():
+    frame = pd.DataFrame({
+        'PRODUCTNAME': ['Bulk Flower', 'Flower 3.5g', 'Gummies', 'Preroll 5pk', 'Cart', 'Odd'],
+        'QUANTITY': [2.0, 7.0, 3.0, 2.0, 1.0, 4.0],
+        'UNITSPERCASE': [1.0, 1.0, 10.0, 5.0, None, 2.0],
+        'WEIGHTUNIT': pd.Series([' Grams ', 'Grams', 'Units', 'Case', None, 3.5], dtype=object),
+    })
+    units = convert_to_units(frame, 'wholesale_sales')
+    # a non-text weight unit cannot be stripped, so the row converts to 0 as before
+    assert np.allclose(units.tolist(), [2.0 * 453.6, 7.0, 3.0, 10.0, 1.0, 0.0])
@@ -0,0 +1,148 @@
+import re
+import unicodedata
+import numpy as np
+import pandas as pd
+
+# ---------------------- Patterns ----------------------
+# Compiled once per process. Keyword lists become a single alternation, which matches
+# exactly when any(word in text for word in words) does.
+
+def keyword_pattern(words):
+    return re.compile('|'.join(map(re.escape, words)))
+
+# removed one after another in this order (a removal can expose a later word)
+FLAVOR_STOP_WORDS = [
+    'gummy', 'gummies', 'chocolate', 'hybrid', 'indica', 'sativa', 'dab', 'fx', 'nano', 'rso',
+    'cannatini', 'edible', 'infused', 'distillate', 'smalls', 'tops', 'live', 'concentrate',
+    'sauce', 'wax', 'preroll', 'pre-roll',
+]
+FLAVOR_STOP_PATTERN = keyword_pattern(FLAVOR_STOP_WORDS)
+NON_LETTERS         = re.compile(r'[^a-zA-Z\s]')
+WHITESPACE          = re.compile(r'\s+')
+GRAMS_PATTERN       = re.compile(r'(\d+\.?\d*)(g|mg)')
+GRAMS_WORD_PATTERN  = re.compile(r'\b(\d+(\.\d+)?g)\b')
+
+CONCENTRATE_WORDS = keyword_pattern(['shatter', 'wax', 'crumble', 'batter', 'sugar', 'live', 'resin', 'rosin', 'sauce'])
+EDIBLE_WORDS      = keyword_pattern(['gummies', 'chocolate', 'drink', 'edible', 'capsule', 'syrup'])
+VAPE_WORDS        = keyword_pattern(['vape', 'cartridge'])
+
+# (product type, pattern) in priority order; the first pattern found in the lowercased name wins
+TYPE_RULES = {
+    'retail_sales': [
+        ('flower', keyword_pattern(['flower', 'pre-roll', 'preroll', 'smalls', 'tops'])),
+        ('vape', VAPE_WORDS),
+        ('concentrate', CONCENTRATE_WORDS),
+        ('edible', EDIBLE_WORDS),
+    ],
+    'retail_inventory': [
+        ('concentrate', CONCENTRATE_WORDS),
+        ('edible', EDIBLE_WORDS),
+        ('flower', keyword_pattern(['preroll', 'pre-roll'])),
+        ('flower', GRAMS_WORD_PATTERN),
+        ('flower', keyword_pattern(['flower', 'smalls', 'tops', 'bulk'])),
+        ('vape', VAPE_WORDS),
+    ],
+}
+STRAIN_RULES = [(s, keyword_pattern([s])) for s in ('hybrid', 'indica', 'sativa')]
+
+FEATURE_COLUMNS = ['Cleaned PRODUCTNAME', 'PRODUCTGRAMS', 'ProductType', 'FlavorTokens', 'FlavorCleaned', 'StrainType']
+
+# ---------------------- Per-Name Features ----------------------
+
+def clean_name(text):
+    """clean_text: drop AU:/MED: prefixes, strip, lowercase."""
+    return str(text).replace('AU:', '').replace('MED:', '').strip().lower()
+
+def normalize_name(text):
+    """normalize_text: ASCII-fold accents, unify dashes/quotes, collapse whitespace, lowercase."""
+    s = unicodedata.normalize('NFKD', text).encode('ascii', 'ignore').decode('ascii')
+    s = s.replace('\u2013', '-').replace('\u2014', '-').replace('\u2212', '-')
+    s = s.replace('\u2018', "'").replace('\u2019', "'").replace('\u00A0', ' ')
+    return WHITESPACE.sub(' ', s).strip().lower()
+
+def grams_value(lowered):
+    match = GRAMS_PATTERN.search(lowered)
+    if not match:
+        return None
+    val = float(match.group(1))
+    return val if match.group(2) == 'g' else round(val / 1000, 4)
+
+def extract_grams(text):
+    # same in both profiles; nulls parse as "nan" / "none" and give None
+    return grams_value(str(text).lower())
+
+def extract_strain(text):
+    return first_match(str(text).lower(), STRAIN_RULES)
+
+def strip_stop_words(text):
+    # one alternation scan; only names that hold a stop word need the ordered removals
+    if FLAVOR_STOP_PATTERN.search(text):
+        for word in FLAVOR_STOP_WORDS:
+            text = text.replace(word, '')
+    return text
+
+def first_match(lowered, rules):
+    for label, pattern in rules:
+        if pattern.search(lowered):
+            return label
+    return None
+
+def sales_name_features(name):
+    if pd.isna(name):
+        return '', None, None, [], '', None
+    lowered = str(name).lower()
+    # sales drops stop words before non-letters
+    flavor = NON_LETTERS.sub('', strip_stop_words(lowered))
+    return (
+        clean_name(name), grams_value(lowered), first_match(lowered, TYPE_RULES['retail_sales']),
+        [w for w in flavor.split() if len(w) >= 3], flavor.strip(), first_match(lowered, STRAIN_RULES),
+    )
+
+def inventory_name_features(name):
+    # inventory parses str(name) even for nulls, and strips non-letters first
+    lowered = str(name).lower()
+    flavor = strip_stop_words(NON_LETTERS.sub('', lowered))
+    return (
+        normalize_name(clean_name(name)) if pd.notna(name) else '',
+        grams_value(lowered), first_match(lowered, TYPE_RULES['retail_inventory']),
+        [w for w in flavor.split() if len(w) >= 3], flavor.strip(), first_match(lowered, STRAIN_RULES),
+    )
+
+NAME_FEATURES = {
+    'retail_sales': sales_name_features,
+    'retail_inventory': inventory_name_features,
+}
+
+# ---------------------- Feature Stage ----------------------
+
+def text_features(names: pd.Series, profile: str) -> pd.DataFrame:
+    """
+    The product-name feature columns (FEATURE_COLUMNS) for a sales ('retail_sales') or
+    inventory ('retail_inventory') frame: each distinct name is parsed once and the
+    result broadcast to every row, identical to applying that module's
+    clean/grams/type/flavor/strain helpers row by row.
+    """
+    compute = NAME_FEATURES[profile]
+    values = names.to_numpy(dtype=object)
+    null = pd.isna(values)
+    codes = np.empty(len(values), dtype=np.intp)
+    codes[~null], uniques = pd.factorize(values[~null])
+    distinct = list(uniques)
+    # nulls are grouped by their text ('nan' / 'None'), since the inventory helpers parse str(name)
+    null_groups = {}
+    for pos in np.flatnonzero(null):
+        v = values[pos]
+        if str(v) not in null_groups:
+            null_groups[str(v)] = len(distinct)
+            distinct.append(v)
+        codes[pos] = null_groups[str(v)]
+
+    parsed = [compute(v) for v in distinct]
+    out = {}
+    for j, col in enumerate(FEATURE_COLUMNS):
+        column = np.empty(len(parsed), dtype=object)
+        for i, features in enumerate(parsed):
+            column[i] = features[j]
+        # built from a list so dtypes match what Series.apply infers (float64 grams when any)
+        out[col] = pd.Series(list(column[codes]), index=names.index)
+    return pd.DataFrame(out, index=names.index)
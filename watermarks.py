@@ -0,0 +1,68 @@
+import datetime
+import json
+import os
+import pandas as pd
+from match_cache import MATCH_CACHE_PATH
+from pipeline_log import get_logger
+
+log = get_logger("watermarks")
+
+# ——— PARAMETERS ———
+# One watermark per source: the last TRANSACTIONDATE (retail) / DELIVERYDATE (wholesale) that was
+# loaded into the target tables. Kept next to the match cache so the workflow's cache step carries it;
+# a missing or unreadable file just means one full-window run.
+WATERMARK_PATH   = os.getenv("WATERMARK_PATH", os.path.join(os.path.dirname(MATCH_CACHE_PATH) or ".", "watermarks.json"))
+INCREMENTAL      = os.getenv("INCREMENTAL", "1").strip().lower() not in ("0", "false", "no")
+RESTATEMENT_DAYS = int(os.getenv("RESTATEMENT_DAYS", "7"))  # trailing days re-pulled for late voids / returns
+FULL_WINDOW_DAYS = 90                                        # first run, or INCREMENTAL=0
+
+# ---------------------- Watermark File ----------------------
+
+def load_watermarks(path: str = WATERMARK_PATH) -> dict:
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, encoding="utf-8") as f:
+            return {k: datetime.date.fromisoformat(v) for k, v in json.load(f).items()}
+    except Exception as e:
+        log.warning("⚠️ Watermarks unreadable, running full window: %s", e)
+        return {}
+
+def save_watermark(source: str, loaded_through, path: str = WATERMARK_PATH):
+    """Record `loaded_through` for `source`; call only after its rows are committed to the target."""
+    if loaded_through is None:
+        return
+    marks = load_watermarks(path)
+    marks[source] = loaded_through
+    try:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({k: v.isoformat() for k, v in marks.items()}, f, indent=2)
+        os.replace(path + ".tmp", path)
+        log.debug("Watermark %s -> %s", source, loaded_through)
+    except Exception as e:
+        log.warning("⚠️ Could not save watermark for %s (next run re-pulls more): %s", source, e)
+
+# ---------------------- Extract Window ----------------------
+
+def extract_window(source: str, today=None, path: str = WATERMARK_PATH):
+    """
+    (start_date, end_date) to extract for `source`: from RESTATEMENT_DAYS before its watermark
+    through today, or the last FULL_WINDOW_DAYS when there is no watermark / INCREMENTAL=0.
+    """
+    end_date = today or datetime.date.today()
+    mark = load_watermarks(path).get(source) if INCREMENTAL else None
+    if mark is None:
+        start_date = end_date - datetime.timedelta(days=FULL_WINDOW_DAYS)
+        log.info("📅 %s: full window %s..%s", source, start_date, end_date)
+    else:
+        start_date = min(mark - datetime.timedelta(days=RESTATEMENT_DAYS), end_date)
+        log.info("📅 %s: incremental %s..%s (watermark %s, %d-day restatement)",
+                 source, start_date, end_date, mark, RESTATEMENT_DAYS)
+    return start_date, end_date
+
+def loaded_through(*frames, column: str = "TRANSACTIONDATE"):
+    """Latest `column` date across `frames` (None when there are no rows)."""
+    dates = [pd.to_datetime(df[column]).max() for df in frames if df is not None and column in df.columns and len(df)]
+    dates = [d for d in dates if pd.notna(d)]
+    return max(dates).date() if dates else None
@@ -1,104 +1,38 @@
-def run_wholesale_cleaning():
+def run_wholesale_cleaning(start_date=None, end_date=None):
     import pandas as pd
     import os
     import datetime
-    import snowflake.connector
+    import time
+    from snowflake_sessions import get_connection
+    from snowflake_fetch import fetch_frame
+    from extract_queries import EXTRACTS, QUERY_TIMEOUT, between, build_query
+    from product_rules import convert_to_units
+    from pipeline_log import get_logger, stage_summary
+    from checkpoints import reuse
+
+    log = get_logger("wholesale_sales")
+    started = time.perf_counter()
 
     # --- CONFIG ---
     output_base_dir = r"C:\Users\Mitch\OneDrive\Desktop\Consulting\Vitalis Files\NEA\Match_Archive"
 
     # --- Query Date Range ---
-    end_date = datetime.date.today()
-    start_date = end_date - datetime.timedelta(days=90)
+    end_date = end_date or datetime.date.today()
+    start_date = start_date or end_date - datetime.timedelta(days=90)
     
-    # --- Snowflake Connection ---
-    conn = snowflake.connector.connect(
-        user=os.environ.get("NEA_SF_USER"), 
-        password=os.environ.get("NEA_SF_PASS"), 
-        account=os.environ.get("NEA_SF_ACCT"),
-        role="READ_ONLY_NEA",
-        warehouse="COMPUTE_WH",
-        database="NEA_SALES",
-        schema="WHOLESALE"
-    )
-
-    # --- Query Wholesale Data ---
-    with conn.cursor() as cs:
-        cs.execute("ALTER SESSION SET USE_CACHED_RESULT = FALSE")
-        cs.execute(f"""
-            SELECT
-                'Wholesale' AS LOCATIONNAME,
-                DELIVERYDATE AS TRANSACTIONDATE,
-                PRODUCTNAME,
-                BRAND AS BRANDNAME,
-                PRODUCTSKU,
-                WEIGHTUNIT,
-                UNITSPERCASE,
-                PRODUCTSKU AS "S&OP Category",
-                BUYERNAME,
-                SUM(QUANTITY) AS QUANTITY,
-                SUM(LINETOTAL) AS TOTAL_REVENUE
-            FROM VWHOLESALESALES
-            WHERE DELIVERYDATE BETWEEN '{start_date}' AND '{end_date}'
-                AND LOWER(BUYERNAME) NOT IN (
-                    'northeast alternatives - fall river',
-                    'near / northeast alternatives retail, llc - seekonk',
-                    'near / northeast alternatives retail, llc - new bedford'
-                )
-            GROUP BY
-                DELIVERYDATE,
-                PRODUCTNAME,
-                BRAND,
-                PRODUCTSKU,
-                WEIGHTUNIT,
-                UNITSPERCASE,
-                BUYERNAME
-        """)
-        rows = cs.fetchall()
-        columns = [col[0] for col in cs.description]
-        wholesale_df = pd.DataFrame(rows, columns=columns)
-
-    conn.close()
-
-    # --- Convert to Unit Count ---
-    def convert_to_units(row):
-        try:
-            weight_unit = row.get('WEIGHTUNIT', '').strip() if row.get('WEIGHTUNIT') else ''
-            product_name = row.get('PRODUCTNAME', '').upper() if row.get('PRODUCTNAME') else ''
-            quantity = row.get('QUANTITY', 0)
-            units_per_case = row.get('UNITSPERCASE', 1)
-            
-            # Handle None values
-            if quantity is None:
-                quantity = 0
-            if units_per_case is None:
-                units_per_case = 1
-                
-            quantity = float(quantity)
-            units_per_case = float(units_per_case)
-            
-            # Debug logging for bulk/trim products
-            if 'BULK' in product_name or 'TRIM' in product_name:
-                print(f"🔧 SALES Converting: {product_name} | {quantity} {weight_unit} → ", end="")
-            
-            if weight_unit == 'Grams':
-                if 'BULK' in product_name or 'TRIM' in product_name:
-                    result = quantity * 453.6  # Convert pounds to grams
-                    print(f"{result} grams")
-                    return result
-                else:
-                    return quantity  # Already in grams
-            elif weight_unit in ['Units', 'Unit']:
-                return quantity
-            else:
-                return quantity * units_per_case
-                
-        except Exception as e:
-            print(f"⚠️ SALES Conversion error: {e} | Row: {row.get('PRODUCTNAME', 'Unknown')}")
-            return 0.0
-
-    # Apply conversion (FIXED: removed duplicate line)
-    wholesale_df['UNIT_COUNT'] = wholesale_df.apply(convert_to_units, axis=1)
+    # --- Snowflake Connection (shared source session, see snowflake_sessions.py) ---
+    conn = get_connection('source')
+
+    # --- Query Wholesale Data (buyer exclusions + columns in extract_queries.py) ---
+    def pull():
+        with conn.cursor() as cs:
+            cs.execute(*build_query(EXTRACTS['wholesale_sales'], between("DELIVERYDATE", start_date, end_date)),
+                       timeout=QUERY_TIMEOUT)
+            return fetch_frame(cs)
+    wholesale_df = reuse(f"wholesale_sales.raw.{start_date}..{end_date}", pull)  # checkpointed under run_pipeline.py
+
+    # --- Convert to Unit Count (rules in product_rules.py) ---
+    wholesale_df['UNIT_COUNT'] = convert_to_units(wholesale_df, 'wholesale_sales')
 
     # --- Mark matches and unmatched ---
     wholesale_df['Matched S&OP Category'] = wholesale_df['S&OP Category']
@@ -150,6 +84,7 @@ def run_wholesale_cleaning():
     category_summary.to_csv(os.path.join(run_folder, "matched_category_summary.csv"), index=False)
     daily_summary.to_csv(os.path.join(run_folder, "daily_category_summary.csv"), index=False)
 
-    print(f"✅ Wholesale Match Complete: {len(matched)}/{len(wholesale_df)}")
+    stage_summary(log, "Wholesale sales cleaning", started, rows=len(wholesale_df), matched=len(matched),
+                  unmatched=len(unmatched), dates=f"{start_date}..{end_date}")
 
     return matched_final.copy(), unmatched_final.copy(), category_summary.copy(), daily_summary.copy()
\ No newline at end of file